@@ -1,7 +1,31 @@
+import contextvars
+import random
+import re
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import anthropic
+import httpx
+from search_tools import TransientToolError
+
+# Shared keep-alive connection pool so rounds and retries reuse TLS connections
+_http_client = anthropic.DefaultHttpxClient(
+    limits=httpx.Limits(
+        max_keepalive_connections=20, max_connections=50, keepalive_expiry=300
+    )
+)
+
+# API failures worth retrying: rate limits, network/timeouts, overloaded servers
+TRANSIENT_API_ERRORS = (
+    anthropic.RateLimitError,
+    anthropic.APIConnectionError,
+    anthropic.InternalServerError,
+)
+
+# Shared pool for running independent tool calls concurrently
+_tool_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tool")
 
 
 class AIGenerator:
@@ -13,9 +37,7 @@ class AIGenerator:
 Tool Usage Guidelines:
 - **Content search tool**: Use for questions about specific course content, materials, or detailed educational information within courses
 - **Course outline tool**: Use for questions about course structure, lesson lists, course titles, instructors, or course overviews
-- **Sequential tool usage**: You can make up to 2 tool calls in separate rounds to gather comprehensive information
-- **Multi-step reasoning**: After seeing tool results, you can make additional tool calls if needed to fully answer the question
-- **Tool call strategy**: Use results from first tool call to inform parameters for second tool call
+- **Tool calls in one round**: You may not get to call tools again after seeing results, so request every search you need (for example an outline and a content search) together
 - Synthesize all tool results into accurate, fact-based responses
 - If any tool yields no results, state this clearly without offering alternatives
 
@@ -23,7 +45,7 @@ Response Protocol:
 - **General knowledge questions**: Answer using existing knowledge without using tools
 - **Course content questions**: Use content search tool first, then additional searches if needed
 - **Course structure/outline questions**: Use course outline tool first, then content search if needed
-- **Complex queries**: Break down into multiple targeted tool calls across rounds
+- **Complex queries**: Break down into multiple targeted tool calls made together
 - **No meta-commentary**: Provide direct answers only — no reasoning process, tool explanations, or question-type analysis
 
 For outline queries, always include:
@@ -39,12 +61,42 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # Instructions for answering several general-knowledge questions in one call
+    BATCH_PROMPT = """Answer each of the following questions independently.
+Return every answer inside its own tag using the question's id, in order, like:
+<answers><answer id="1">...</answer><answer id="2">...</answer></answers>
+
+Questions:
+"""
+
+    # Matches one tagged answer in a batched response
+    BATCH_ANSWER_PATTERN = re.compile(r'<answer id="(\d+)">(.*?)</answer>', re.DOTALL)
+
+    # Tool choices for rounds that may call tools and for the final answer
+    TOOL_CHOICE_AUTO = MappingProxyType({"type": "auto"})
+    TOOL_CHOICE_NONE = MappingProxyType({"type": "none"})
+
+    # Base delay in seconds for exponential backoff between retries
+    RETRY_BASE_DELAY = 1.0
+
+    def __init__(self, api_key: str, model: str, cache_ttl: str = "5m"):
+        self.client = anthropic.Anthropic(api_key=api_key, http_client=_http_client)
         self.model = model
 
         # Pre-build base API parameters
-        self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
+        self.base_params = MappingProxyType(
+            {"model": self.model, "temperature": 0, "max_tokens": 800}
+        )
+
+        # Prompt caching breakpoint shared by system blocks and tool results
+        self.cache_control = {"type": "ephemeral", "ttl": cache_ttl}
+
+        # Static system prompt block, built once and shared by every request
+        self.system_prompt_block = {
+            "type": "text",
+            "text": self.SYSTEM_PROMPT,
+            "cache_control": self.cache_control,
+        }
 
     def generate_response(
         self,
@@ -62,70 +114,301 @@ Provide only the direct answer to what was asked.
             conversation_history: Previous messages for context
             tools: Available tools the AI can use
             tool_manager: Manager to execute tools
-            max_rounds: Maximum number of tool calling rounds (default: 2)
+            max_rounds: Maximum API calls; the last one answers without tools
+                (default: 2, one tool round and the answer)
 
         Returns:
             Generated response as string
         """
 
-        # Build system content efficiently
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
+        # Build cacheable system blocks (static prompt first, history last)
+        system_content = self._build_system_blocks(conversation_history)
 
         # Initialize conversation with user query
         messages = [{"role": "user", "content": query}]
 
-        # Execute sequential tool calling rounds
-        for round_num in range(max_rounds):
-            # Prepare API call parameters
-            api_params = {
-                **self.base_params,
-                "messages": messages.copy(),
-                "system": system_content,
-            }
+        # Tool result block currently carrying the message cache breakpoint
+        cached_block = None
+
+        # Prepare API call parameters once; messages grows in place per round
+        tool_params, final_params = self._build_round_params(
+            messages, system_content, tools
+        )
 
-            # Add tools if available (keep tools available for all rounds)
-            if tools:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = {"type": "auto"}
+        # Set once a tool's backend stays down; the next round answers without it
+        tools_down = False
+
+        # Execute tool calling rounds; the last one is the synthesis call
+        for round_num in range(max_rounds):
+            # The final round is the synthesis call, so tool use is disabled.
+            # Tools stay defined to keep the cached prompt prefix intact.
+            final_round = round_num == max_rounds - 1 or tools_down
+            api_params = final_params if final_round else tool_params
 
             # Get response from Claude with retry logic
             response = self._api_call_with_retry(api_params)
 
+            # Stop on the final round or when Claude doesn't want tools
+            if final_round or response.stop_reason != "tool_use" or not tool_manager:
+                break
+
             # Add Claude's response to conversation
-            messages.append({"role": "assistant", "content": response.content})
-
-            # Check if Claude wants to use tools
-            if response.stop_reason == "tool_use" and tool_manager:
-                # Execute tools and add results to conversation
-                tool_results = self._execute_tools_for_round(response, tool_manager)
-                if tool_results:
-                    messages.append({"role": "user", "content": tool_results})
-                    continue  # Go to next round
-                else:
-                    # Tool execution failed, break and return current response
-                    break
-            else:
-                # No tool use, we have our final response
+            messages.append(
+                {"role": "assistant", "content": self._serialize_content(response)}
+            )
+
+            # Execute tools and add results to conversation
+            tool_results = self._execute_tools_for_round(response, tool_manager)
+            if not tool_results:
+                # No tool calls to answer, return the current response
                 break
 
-        # If we exhausted all rounds or no tools were used, get final response
-        if messages[-1]["role"] == "user":  # Last message was tool results
-            # Need one final call to synthesize
-            final_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": system_content,
-                # Note: Intentionally NOT including tools for final synthesis
+            tools_down = self._has_error_result(tool_results)
+            cached_block = self._move_cache_breakpoint(cached_block, tool_results)
+            messages.append({"role": "user", "content": tool_results})
+
+        return self._response_text(response)
+
+    def stream_response(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+        max_rounds: int = 2,
+    ) -> Iterator[str]:
+        """
+        Stream AI response text with sequential tool calling support.
+
+        Each tool is submitted for execution as soon as its tool_use block
+        finishes streaming, so vector searches overlap with Claude generating
+        the rest of the response.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            max_rounds: Maximum API calls; the last one answers without tools
+                (default: 2, one tool round and the answer)
+
+        Yields:
+            Text deltas as they are generated
+        """
+        system_content = self._build_system_blocks(conversation_history)
+        messages = [{"role": "user", "content": query}]
+        cached_block = None
+
+        tool_params, final_params = self._build_round_params(
+            messages, system_content, tools
+        )
+        tools_down = False
+
+        for round_num in range(max_rounds):
+            # The final round is the synthesis call, so tool use is disabled
+            final_round = round_num == max_rounds - 1 or tools_down
+            api_params = final_params if final_round else tool_params
+
+            tool_futures: Dict[str, Future] = {}
+            with self._open_stream_with_retry(api_params) as stream:
+                for event in stream:
+                    if event.type == "text":
+                        yield event.text
+                    elif (
+                        event.type == "content_block_stop"
+                        and event.content_block.type == "tool_use"
+                        and tool_manager
+                    ):
+                        # Start the tool now instead of waiting for the full message
+                        block = event.content_block
+                        tool_futures[block.id] = self._submit_tool(
+                            tool_manager, block.name, block.input
+                        )
+                response = stream.get_final_message()
+
+            if final_round or response.stop_reason != "tool_use" or not tool_futures:
+                return
+
+            messages.append(
+                {"role": "assistant", "content": self._serialize_content(response)}
+            )
+
+            tool_results = self._collect_tool_results(tool_futures)
+            if not tool_results:
+                # No tool calls to answer, stop with what has been streamed
+                return
+
+            tools_down = self._has_error_result(tool_results)
+            cached_block = self._move_cache_breakpoint(cached_block, tool_results)
+            messages.append({"role": "user", "content": tool_results})
+
+    def generate_responses_batched(
+        self, queries: List[str], batch_size: int = 10
+    ) -> List[str]:
+        """
+        Answer many tool-free questions with one API call per batch.
+
+        Intended for offline or evaluation runs of general-knowledge questions;
+        queries that need course search should go through generate_response.
+
+        Args:
+            queries: Questions to answer
+            batch_size: Maximum questions sent in a single API call
+
+        Returns:
+            Answers in the same order as queries
+        """
+        system_content = self._build_system_blocks()
+        answers = []
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start : start + batch_size]
+            numbered = "\n".join(
+                f"{i}. {question}" for i, question in enumerate(batch, start=1)
+            )
+
+            response = self._api_call_with_retry(
+                {
+                    **self.base_params,
+                    "max_tokens": self.base_params["max_tokens"] * len(batch),
+                    "messages": [
+                        {"role": "user", "content": self.BATCH_PROMPT + numbered}
+                    ],
+                    "system": system_content,
+                }
+            )
+
+            parsed = {
+                int(answer_id): answer.strip()
+                for answer_id, answer in self.BATCH_ANSWER_PATTERN.findall(
+                    response.content[0].text
+                )
             }
-            final_response = self._api_call_with_retry(final_params)
-            return final_response.content[0].text
-        else:
-            # Last message was from assistant without tool use
-            return response.content[0].text
+
+            for i, question in enumerate(batch, start=1):
+                if i in parsed:
+                    answers.append(parsed[i])
+                else:
+                    # Malformed or truncated batch output, answer this one alone
+                    answers.append(self.generate_response(question))
+
+        return answers
+
+    def _build_round_params(
+        self,
+        messages: List[Dict[str, Any]],
+        system_content: List[Dict[str, Any]],
+        tools: Optional[List] = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Build API call parameters for tool rounds and the final round.
+
+        Both share the same messages list, which is only appended to between
+        rounds, so no parameters need rebuilding once the loop starts.
+
+        Args:
+            messages: Conversation messages for this request
+            system_content: System blocks for this request
+            tools: Available tools the AI can use
+
+        Returns:
+            Tuple of (params for tool rounds, params for the final round)
+        """
+        tool_params = {
+            **self.base_params,
+            "messages": messages,
+            "system": system_content,
+        }
+        if not tools:
+            return tool_params, tool_params
+
+        tool_params["tools"] = tools
+        final_params = {**tool_params, "tool_choice": self.TOOL_CHOICE_NONE}
+        tool_params["tool_choice"] = self.TOOL_CHOICE_AUTO
+        return tool_params, final_params
+
+    def _build_system_blocks(
+        self, conversation_history: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Build system content blocks with prompt caching breakpoints.
+
+        The static system prompt is always the first block so it stays a stable
+        cached prefix; conversation history changes per exchange and goes last.
+
+        Args:
+            conversation_history: Previous messages for context
+
+        Returns:
+            List of system text blocks
+        """
+        if not conversation_history:
+            return [self.system_prompt_block]
+
+        return [
+            self.system_prompt_block,
+            {
+                "type": "text",
+                "text": f"Previous conversation:\n{conversation_history}",
+                "cache_control": self.cache_control,
+            },
+        ]
+
+    def _serialize_content(self, response) -> List[Dict[str, Any]]:
+        """
+        Convert response content blocks to plain dicts for the message history.
+
+        Plain dicts are cheap to re-encode on every later round and serialize
+        to identical bytes each time, keeping the cached prompt prefix stable.
+
+        Args:
+            response: Claude's response to add to the conversation
+
+        Returns:
+            List of text and tool_use content dicts
+        """
+        content = []
+        for block in response.content:
+            if block.type == "tool_use":
+                content.append(
+                    {
+                        "type": "tool_use",
+                        "id": block.id,
+                        "name": block.name,
+                        "input": block.input,
+                    }
+                )
+            elif block.type == "text":
+                content.append({"type": "text", "text": block.text})
+
+        return content
+
+    def _response_text(self, response) -> str:
+        """Join a response's text blocks, skipping any tool_use blocks"""
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    def _has_error_result(self, tool_results: List[Dict]) -> bool:
+        """Check whether any tool call in a round ended with its backend down"""
+        return any(result.get("is_error") for result in tool_results)
+
+    def _move_cache_breakpoint(
+        self, cached_block: Optional[Dict[str, Any]], tool_results: List[Dict]
+    ) -> Dict[str, Any]:
+        """
+        Move the message cache breakpoint onto the newest tool results.
+
+        Args:
+            cached_block: Tool result block currently carrying the breakpoint
+            tool_results: Tool results about to be added to the conversation
+
+        Returns:
+            The block now carrying the breakpoint
+        """
+        if cached_block is not None:
+            cached_block.pop("cache_control", None)
+
+        tool_results[-1]["cache_control"] = self.cache_control
+        return tool_results[-1]
 
     def _api_call_with_retry(self, api_params: Dict[str, Any], max_retries: int = 2):
         """
@@ -142,117 +425,173 @@ Provide only the direct answer to what was asked.
             try:
                 return self.client.messages.create(**api_params)
             except Exception as e:
-                if attempt == max_retries:
+                delay = self._retry_delay(e, attempt)
+                if attempt == max_retries or delay is None:
+                    # Out of retries, or not a transient error
                     raise e
 
-                error_msg = str(e).lower()
-                if (
-                    "rate limit" in error_msg
-                    or "network" in error_msg
-                    or "connection" in error_msg
-                ):
-                    # Add exponential backoff for retries
-                    time.sleep(2**attempt)
-                else:
-                    # For other errors, don't retry
+                time.sleep(delay)
+
+    def _open_stream_with_retry(self, api_params: Dict[str, Any], max_retries: int = 2):
+        """
+        Open a message stream with retry logic for transient failures.
+
+        The request is sent when the stream is opened, so failures here happen
+        before any text is yielded and retrying never repeats output.
+
+        Args:
+            api_params: API call parameters
+            max_retries: Maximum retry attempts
+
+        Returns:
+            The open message stream, to be closed by the caller
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return self.client.messages.stream(**api_params).__enter__()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if attempt == max_retries or delay is None:
                     raise e
 
+                time.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Get the wait before retrying a failed API call.
+
+        Honors the server's Retry-After header on rate limits; otherwise uses
+        jittered exponential backoff so concurrent clients don't retry in step.
+
+        Args:
+            error: Exception raised by the API call
+            attempt: Zero-based attempt number that failed
+
+        Returns:
+            Seconds to wait, or None if the error should not be retried
+        """
+        if isinstance(error, anthropic.RateLimitError):
+            retry_after = error.response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+
+        if not isinstance(error, TRANSIENT_API_ERRORS):
+            return None
+
+        return self._backoff_delay(attempt)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Jittered exponential backoff for the given zero-based attempt"""
+        return self.RETRY_BASE_DELAY * (2**attempt) * random.uniform(0.5, 1.5)
+
     def _execute_tools_for_round(self, response, tool_manager) -> Optional[List[Dict]]:
         """
-        Execute all tool calls from a response and return formatted results.
+        Execute all tool calls from a response concurrently and return results.
+
+        Tool calls in the same round are independent, so they are dispatched to
+        the shared pool together and results are collected in original order.
 
         Args:
             response: Claude's response containing tool use requests
             tool_manager: Manager to execute tools
 
         Returns:
-            List of tool results or None if execution failed
+            List of tool results or None if there were no tool calls
         """
-        tool_results = []
+        tool_futures = {
+            content_block.id: self._submit_tool(
+                tool_manager, content_block.name, content_block.input
+            )
+            for content_block in response.content
+            if content_block.type == "tool_use"
+        }
 
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                try:
-                    tool_result = tool_manager.execute_tool(
-                        content_block.name, **content_block.input
-                    )
-
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": tool_result,
-                        }
-                    )
-
-                except Exception as e:
-                    # Log error but continue with other tools
-                    error_msg = str(e)
-                    if (
-                        "rate limit" in error_msg.lower()
-                        or "network" in error_msg.lower()
-                    ):
-                        # For transient errors, return None to stop rounds
-                        return None
-                    else:
-                        # For other errors, continue with error message
-                        tool_results.append(
-                            {
-                                "type": "tool_result",
-                                "tool_use_id": content_block.id,
-                                "content": f"Tool execution failed: {error_msg}",
-                            }
-                        )
+        return self._collect_tool_results(tool_futures)
 
-        return tool_results if tool_results else None
+    def _submit_tool(self, tool_manager, name: str, tool_input: Dict) -> Future:
+        """
+        Start a tool call on the shared pool.
 
-    def _handle_tool_execution(
-        self, initial_response, base_params: Dict[str, Any], tool_manager
-    ):
+        The call runs in a copy of the caller's context so request-scoped
+        state, like the tool manager's source tracking, follows it.
         """
-        Handle execution of tool calls and get follow-up response.
+        context = contextvars.copy_context()
+        return _tool_executor.submit(
+            context.run, self._execute_tool_with_retry, tool_manager, name, tool_input
+        )
+
+    def _execute_tool_with_retry(
+        self, tool_manager, name: str, tool_input: Dict, max_retries: int = 2
+    ) -> str:
+        """
+        Execute a tool call, retrying while its backend is temporarily down.
+
+        Raises:
+            TransientToolError: If the backend is still unavailable after retries
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return tool_manager.execute_tool(name, **tool_input)
+            except TransientToolError:
+                if attempt == max_retries:
+                    raise
+
+                time.sleep(self._backoff_delay(attempt))
+
+    def _collect_tool_results(
+        self, tool_futures: Dict[str, Future]
+    ) -> Optional[List[Dict]]:
+        """
+        Wait for submitted tool calls and return formatted results.
 
         Args:
-            initial_response: The response containing tool use requests
-            base_params: Base API parameters
-            tool_manager: Manager to execute tools
+            tool_futures: Pending tool executions keyed by tool_use id
 
         Returns:
-            Final response text after tool execution
+            List of tool results or None if there were no tool calls
         """
-        # Start with existing messages
-        messages = base_params["messages"].copy()
+        outcomes = []
+        for future in tool_futures.values():
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
 
-        # Add AI's tool use response
-        messages.append({"role": "assistant", "content": initial_response.content})
+        return self._build_tool_results(list(tool_futures), outcomes)
 
-        # Execute all tool calls and collect results
-        tool_results = []
-        for content_block in initial_response.content:
-            if content_block.type == "tool_use":
-                tool_result = tool_manager.execute_tool(
-                    content_block.name, **content_block.input
-                )
+    def _build_tool_results(
+        self, tool_use_ids: List[str], outcomes: List[Any]
+    ) -> Optional[List[Dict]]:
+        """
+        Format tool outcomes as tool_result blocks.
 
-                tool_results.append(
-                    {
-                        "type": "tool_result",
-                        "tool_use_id": content_block.id,
-                        "content": tool_result,
-                    }
-                )
+        A tool whose backend is still down after retries gets an error result,
+        which makes the next round answer without tools.
 
-        # Add tool results as single message
-        if tool_results:
-            messages.append({"role": "user", "content": tool_results})
+        Args:
+            tool_use_ids: Ids of the tool_use blocks, in original order
+            outcomes: Tool output string or raised exception for each id
 
-        # Prepare final API call without tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": base_params["system"],
-        }
+        Returns:
+            List of tool results or None if there were no tool calls
+        """
+        tool_results = []
+
+        for tool_use_id, tool_result in zip(tool_use_ids, outcomes):
+            block = {"type": "tool_result", "tool_use_id": tool_use_id}
+            if isinstance(tool_result, TransientToolError):
+                # Let Claude answer around the outage instead of retrying it
+                block["content"] = f"Tool unavailable: {tool_result}"
+                block["is_error"] = True
+            elif isinstance(tool_result, Exception):
+                # For other errors, continue with error message
+                block["content"] = f"Tool execution failed: {tool_result}"
+            else:
+                block["content"] = tool_result
 
-        # Get final response
-        final_response = self.client.messages.create(**final_params)
-        return final_response.content[0].text
+            tool_results.append(block)
+
+        return tool_results if tool_results else None
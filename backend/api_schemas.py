@@ -0,0 +1,116 @@
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    TypeVar,
+)
+
+import orjson
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError
+
+
+# Pydantic models for request/response
+class QueryRequest(BaseModel):
+    """Request model for course queries"""
+
+    query: str
+    # Checked by pydantic-core's Rust regex engine, which runs in linear time
+    session_id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_-]{0,64}$")
+
+
+class SourceData(BaseModel):
+    """Model for source data with optional lesson link"""
+
+    display_text: str
+    lesson_link: Optional[str] = None
+
+
+class QueryResponse(BaseModel):
+    """Response model for course queries"""
+
+    answer: str
+    sources: List[SourceData]
+    session_id: str
+    # Set when generation failed after part of the answer was streamed
+    error: Optional[str] = None
+
+
+class CourseStats(BaseModel):
+    """Response model for course statistics"""
+
+    total_courses: int
+    course_titles: List[str]
+
+
+def stream_query_response(
+    answer_chunks: Generator[str, None, List[Dict[str, Optional[str]]]],
+    session_id: str,
+) -> Iterator[bytes]:
+    """Encode a streamed answer as QueryResponse JSON, fragment by fragment"""
+    # The first fragment always carries the opening of the object, so pulling
+    # it runs the RAG system up to its first text delta
+    prefix = b'{"answer":"'
+    error = None
+    try:
+        while True:
+            # Strip the quotes orjson adds around each escaped delta
+            yield prefix + orjson.dumps(next(answer_chunks))[1:-1]
+            prefix = b""
+    except StopIteration as done:
+        sources = done.value
+    except Exception as e:
+        if prefix:
+            # Nothing sent yet, so the endpoint can still answer with a 500
+            raise
+        # The 200 status is already sent; close the object and report the error
+        sources, error = [], str(e)
+
+    tail = [
+        prefix,
+        b'","sources":',
+        orjson.dumps(sources),
+        b',"session_id":',
+        orjson.dumps(session_id),
+    ]
+    if error is not None:
+        tail += [b',"error":', orjson.dumps(error)]
+    tail.append(b"}")
+    yield b"".join(tail)
+
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def json_body(model: Type[ModelT]) -> Callable[[Request], Any]:
+    """Build a dependency that parses and validates a JSON body in pydantic-core"""
+
+    async def parse(request: Request) -> ModelT:
+        # One Rust pass instead of json.loads followed by dict validation
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [
+                    {**error, "loc": ("body", *error["loc"])}
+                    for error in e.errors(include_url=False)
+                ]
+            )
+
+    return parse
+
+
+def json_body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Describe a json_body dependency's request body for the OpenAPI docs"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+        }
+    }
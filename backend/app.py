@@ -3,18 +3,36 @@ import warnings
 warnings.filterwarnings("ignore", message="resource_tracker: There appear to be.*")
 
 import os
-from typing import Any, Dict, List, Optional
-
+from itertools import chain
+
+from api_schemas import (
+    CourseStats,
+    QueryRequest,
+    QueryResponse,
+    json_body,
+    json_body_schema,
+    stream_query_response,
+)
 from config import config
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
 from rag_system import RAGSystem
+from request_limits import RequestLimitMiddleware
+from starlette.concurrency import run_in_threadpool
+
+# Initialize FastAPI app; orjson serializes JSON responses much faster than json
+app = FastAPI(
+    title="Course Materials RAG System",
+    root_path="",
+    default_response_class=ORJSONResponse,
+)
 
-# Initialize FastAPI app
-app = FastAPI(title="Course Materials RAG System", root_path="")
+# Reject oversized or non-JSON API bodies before they reach validation; added
+# first so it runs innermost and its 413/415 responses still get CORS headers
+app.add_middleware(RequestLimitMiddleware, max_body_bytes=config.MAX_REQUEST_BYTES)
 
 # Add trusted host middleware for proxy
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
@@ -33,41 +51,15 @@ app.add_middleware(
 rag_system = RAGSystem(config)
 
 
-# Pydantic models for request/response
-class QueryRequest(BaseModel):
-    """Request model for course queries"""
-
-    query: str
-    session_id: Optional[str] = None
-
-
-class SourceData(BaseModel):
-    """Model for source data with optional lesson link"""
-
-    display_text: str
-    lesson_link: Optional[str] = None
-
-
-class QueryResponse(BaseModel):
-    """Response model for course queries"""
-
-    answer: str
-    sources: List[SourceData]
-    session_id: str
-
-
-class CourseStats(BaseModel):
-    """Response model for course statistics"""
-
-    total_courses: int
-    course_titles: List[str]
-
-
 # API Endpoints
 
 
-@app.post("/api/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+@app.post(
+    "/api/query",
+    response_model=QueryResponse,
+    openapi_extra=json_body_schema(QueryRequest),
+)
+async def query_documents(request: QueryRequest = Depends(json_body(QueryRequest))):
     """Process a query and return response with sources"""
     try:
         # Create session if not provided
@@ -75,28 +67,22 @@ async def query_documents(request: QueryRequest):
         if not session_id:
             session_id = rag_system.session_manager.create_session()
 
-        # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
-
-        # Convert sources to SourceData objects
-        source_data_list = []
-        for source in sources:
-            if isinstance(source, dict):
-                # New structured format
-                source_data_list.append(
-                    SourceData(
-                        display_text=source.get("display_text", ""),
-                        lesson_link=source.get("lesson_link"),
-                    )
-                )
-            else:
-                # Backward compatibility for string sources
-                source_data_list.append(
-                    SourceData(display_text=str(source), lesson_link=None)
-                )
-
-        return QueryResponse(
-            answer=answer, sources=source_data_list, session_id=session_id
+        # Exact repeats are dict lookups, so answer them without a thread hop
+        cached = rag_system.query_cached(request.query, session_id)
+        if cached is not None:
+            answer, sources = cached
+            return QueryResponse(answer=answer, sources=sources, session_id=session_id)
+
+        # Stream the answer as Claude generates it; sources follow at the end
+        fragments = stream_query_response(
+            rag_system.query_stream(request.query, session_id), session_id
+        )
+
+        # Pull the first fragment here so failures before any text is
+        # generated still surface as a 500 rather than a truncated body
+        first = await run_in_threadpool(next, fragments)
+        return StreamingResponse(
+            chain((first,), fragments), media_type="application/json"
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -106,11 +92,10 @@ async def query_documents(request: QueryRequest):
 async def get_course_stats():
     """Get course analytics and statistics"""
     try:
-        analytics = rag_system.get_course_analytics()
-        return CourseStats(
-            total_courses=analytics["total_courses"],
-            course_titles=analytics["course_titles"],
-        )
+        # Cached bytes go out verbatim; a rebuild reads Chroma, so keep it
+        # off the event loop
+        payload = await run_in_threadpool(rag_system.get_course_analytics_json)
+        return Response(payload, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -130,6 +115,12 @@ async def startup_event():
             print(f"Error loading documents: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled HTTP connections to the Anthropic API"""
+    rag_system.ai_generator.client.close()
+
+
 import os
 from pathlib import Path
 
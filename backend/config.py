@@ -1,5 +1,6 @@
 import os
 from dataclasses import dataclass
+from typing import Optional
 
 from dotenv import load_dotenv
 
@@ -25,12 +26,31 @@ class Config:
     MAX_HISTORY: int = 2  # Number of conversation messages to remember
 
     # Sequential tool calling settings
-    MAX_TOOL_ROUNDS: int = 2  # Maximum sequential tool calling rounds
+    MAX_TOOL_ROUNDS: int = 2  # API calls per query; the last answers without tools
     TOOL_EXECUTION_TIMEOUT: int = 30  # Tool execution timeout in seconds
     MAX_API_RETRIES: int = 2  # Maximum API retry attempts
+    # Standalone queries whose cosine similarity to every course title and chunk
+    # is below this skip the tools. Kept low on purpose: all-MiniLM-L6-v2 gives
+    # loosely related text modest scores, and wrongly skipping the tools costs
+    # a grounded answer while an unneeded tool offer only costs tokens.
+    TOOL_ROUTING_THRESHOLD: float = 0.2
+
+    # Prompt caching settings
+    PROMPT_CACHE_TTL: str = "5m"  # Cache lifetime: "5m" default, "1h" for batch jobs
+
+    # Semantic response cache settings
+    # Cosine similarity for answering a near-duplicate query from the cache. None
+    # answers exact repeats only: MiniLM scores "lesson 2 of X" and "lesson 3 of
+    # X" nearly alike, so if enabled keep it strict (0.98 or more)
+    SEMANTIC_CACHE_THRESHOLD: Optional[float] = None
+    SEMANTIC_CACHE_SIZE: int = 10000  # Maximum cached responses (LRU eviction)
+    SEMANTIC_CACHE_TTL: int = 300  # Seconds; keep in step with PROMPT_CACHE_TTL
+
+    # API request settings
+    MAX_REQUEST_BYTES: int = 1_000_000  # Larger request bodies are rejected with 413
 
     # Database paths
-    CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location
+    CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location, or ":memory:"
 
 
 config = Config()
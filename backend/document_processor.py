@@ -1,99 +1,116 @@
+import multiprocessing
 import os
 import re
-from typing import List, Tuple
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from models import Course, CourseChunk, Lesson
 
+# Whitespace after sentence-ending punctuation and before a capital letter,
+# ignoring common abbreviations such as "e.g." and "Dr."
+SENTENCE_BOUNDARY = re.compile(
+    r"(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\!|\?)\s+(?=[A-Z])"
+)
+
+
+# Course and lesson header lines, matched case-insensitively
+COURSE_TITLE = re.compile(r"^Course Title:\s*(.+)$", re.IGNORECASE)
+COURSE_LINK = re.compile(r"^Course Link:\s*(.+)$", re.IGNORECASE)
+COURSE_INSTRUCTOR = re.compile(r"^Course Instructor:\s*(.+)$", re.IGNORECASE)
+LESSON_HEADER = re.compile(r"^Lesson\s+(\d+):\s*(.+)$", re.IGNORECASE)
+LESSON_LINK = re.compile(r"^Lesson Link:\s*(.+)$", re.IGNORECASE)
+
+
+# A file's identity for the parse cache: (path, mtime_ns, size)
+FileVersion = Tuple[str, int, int]
+
 
 class DocumentProcessor:
     """Processes course documents and extracts structured information"""
 
-    def __init__(self, chunk_size: int, chunk_overlap: int):
+    # Spawned workers take a fraction of a second each to start, so batches
+    # only go to a process pool once they are this many files or bytes
+    PARALLEL_MIN_FILES = 32
+    PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, cache_size: int = 512):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # Parsed documents keyed by file version, so unchanged files are not
+        # re-read, re-chunked or rebuilt on repeat loads
+        self._parse_cache: OrderedDict = OrderedDict()
+        self._parse_cache_size = cache_size
+        self._cache_lock = threading.Lock()
 
     def read_file(self, file_path: str) -> str:
         """Read content from file with UTF-8 encoding"""
-        try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                return file.read()
-        except UnicodeDecodeError:
-            # If UTF-8 fails, try with error handling
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
-                return file.read()
+        with open(file_path, "rb") as file:
+            data = file.read()
+
+        # Course files are almost always ASCII, which is checked a word at a
+        # time and decoded as a plain copy
+        if data.isascii():
+            text = data.decode("ascii")
+        else:
+            # Drop invalid UTF-8 sequences rather than failing the whole file
+            text = data.decode("utf-8", errors="ignore")
+
+        # Match text mode's universal newline translation
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
 
     def chunk_text(self, text: str) -> List[str]:
         """Split text into sentence-based chunks with overlap using config settings"""
 
-        # Clean up the text
-        text = re.sub(r"\s+", " ", text.strip())  # Normalize whitespace
-
-        # Better sentence splitting that handles abbreviations
-        # This regex looks for periods followed by whitespace and capital letters
-        # but ignores common abbreviations
-        sentence_endings = re.compile(
-            r"(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\!|\?)\s+(?=[A-Z])"
-        )
-        sentences = sentence_endings.split(text)
+        # Normalize whitespace; split() collapses the same runs as \s+, in C
+        text = " ".join(text.split())
 
-        # Clean sentences
-        sentences = [s.strip() for s in sentences if s.strip()]
+        # Sentences are separated by single spaces after normalization, so the
+        # size of a run of sentences is just the distance across their spans
+        starts: List[int] = []
+        ends: List[int] = []
+        for start, end in self._sentence_spans(text):
+            starts.append(start)
+            ends.append(end)
 
         chunks = []
         i = 0
 
-        while i < len(sentences):
-            current_chunk = []
-            current_size = 0
-
-            # Build chunk starting from sentence i
-            for j in range(i, len(sentences)):
-                sentence = sentences[j]
-
-                # Calculate size with space
-                space_size = 1 if current_chunk else 0
-                total_addition = len(sentence) + space_size
-
-                # Check if adding this sentence would exceed chunk size
-                if current_size + total_addition > self.chunk_size and current_chunk:
-                    break
-
-                current_chunk.append(sentence)
-                current_size += total_addition
-
-            # Add chunk if we have content
-            if current_chunk:
-                chunks.append(" ".join(current_chunk))
-
-                # Calculate overlap for next chunk
-                if hasattr(self, "chunk_overlap") and self.chunk_overlap > 0:
-                    # Find how many sentences to overlap
-                    overlap_size = 0
-                    overlap_sentences = 0
-
-                    # Count backwards from end of current chunk
-                    for k in range(len(current_chunk) - 1, -1, -1):
-                        sentence_len = len(current_chunk[k]) + (
-                            1 if k < len(current_chunk) - 1 else 0
-                        )
-                        if overlap_size + sentence_len <= self.chunk_overlap:
-                            overlap_size += sentence_len
-                            overlap_sentences += 1
-                        else:
-                            break
-
-                    # Move start position considering overlap
-                    next_start = i + len(current_chunk) - overlap_sentences
-                    i = max(next_start, i + 1)  # Ensure we make progress
-                else:
-                    # No overlap - move to next sentence after current chunk
-                    i += len(current_chunk)
+        while i < len(starts):
+            # Offsets are sorted, so binary search finds the last sentence that
+            # fits; the first sentence is always taken, even if it is too long
+            chunk_start = starts[i]
+            j = max(bisect_right(ends, chunk_start + self.chunk_size, i), i + 1)
+
+            # Slice the chunk out in one copy rather than joining sentences
+            chunk_end = ends[j - 1]
+            chunks.append(text[chunk_start:chunk_end])
+
+            if self.chunk_overlap > 0:
+                # Start the next chunk at the trailing sentences that fit
+                # within the overlap
+                k = bisect_left(starts, chunk_end - self.chunk_overlap, i, j)
+                i = max(k, i + 1)  # Ensure we make progress
             else:
-                # No sentences fit, move to next
-                i += 1
+                # No overlap - move to next sentence after current chunk
+                i = j
 
         return chunks
 
+    def _sentence_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield (start, end) offsets of each sentence in normalized text"""
+        start = 0
+        for boundary in SENTENCE_BOUNDARY.finditer(text):
+            yield start, boundary.start()
+            start = boundary.end()
+        if start < len(text):
+            yield start, len(text)
+
     def process_course_document(
         self, file_path: str
     ) -> Tuple[Course, List[CourseChunk]]:
@@ -104,6 +121,113 @@ class DocumentProcessor:
         Line 3: Course Instructor: [instructor]
         Following lines: Lesson markers and content
         """
+        version = self._file_version(file_path)
+        if version is None:
+            # Let read_file report missing or unreadable files
+            return self._parse_course_document(file_path)
+
+        parsed = self._cached_parse(version)
+        if parsed is None:
+            parsed = self._parse_course_document(file_path)
+            self._cache_parse(version, parsed)
+        return parsed
+
+    def process_many(
+        self, file_paths: List[str]
+    ) -> List[Union[Tuple[Course, List[CourseChunk]], Exception]]:
+        """
+        Process several course documents, in worker processes for big batches.
+
+        Unchanged documents come from the parse cache. The rest are parsed in
+        spawned worker processes once they reach PARALLEL_MIN_FILES or
+        PARALLEL_MIN_BYTES, and inline otherwise; spawning avoids forking a
+        process that may already be running threads.
+
+        Results are returned in the order of file_paths. A document that fails
+        to process yields its exception in place of a result, so one bad file
+        doesn't stop the others.
+        """
+        results: List = [None] * len(file_paths)
+        pending: Dict[int, Tuple[str, Optional[FileVersion]]] = {}
+        for index, file_path in enumerate(file_paths):
+            version = self._file_version(file_path)
+            cached = self._cached_parse(version) if version is not None else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending[index] = (file_path, version)
+
+        pending_bytes = sum(version[2] for _, version in pending.values() if version)
+        if len(pending) < 2 or (
+            len(pending) < self.PARALLEL_MIN_FILES
+            and pending_bytes < self.PARALLEL_MIN_BYTES
+        ):
+            for index, (file_path, _) in pending.items():
+                results[index] = self._process_or_error(file_path)
+            return results
+
+        workers = min(len(pending), os.cpu_count() or 1)
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            outcomes = executor.map(
+                _process_in_worker,
+                repeat(self.chunk_size),
+                repeat(self.chunk_overlap),
+                [file_path for file_path, _ in pending.values()],
+                chunksize=4,
+            )
+            for (index, (_, version)), outcome in zip(pending.items(), outcomes):
+                if version is not None and not isinstance(outcome, Exception):
+                    self._cache_parse(version, outcome)
+                results[index] = outcome
+
+        return results
+
+    def _process_or_error(
+        self, file_path: str
+    ) -> Union[Tuple[Course, List[CourseChunk]], Exception]:
+        """Process a document, returning the exception if it fails"""
+        try:
+            return self.process_course_document(file_path)
+        except Exception as e:
+            return e
+
+    def _file_version(self, file_path: str) -> Optional[FileVersion]:
+        """Get the parse cache key for a file, or None if it can't be read"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return file_path, stat.st_mtime_ns, stat.st_size
+
+    def _cached_parse(
+        self, version: FileVersion
+    ) -> Optional[Tuple[Course, List[CourseChunk]]]:
+        """Return a copy of a cached parse and mark it recently used"""
+        with self._cache_lock:
+            parsed = self._parse_cache.get(version)
+            if parsed is None:
+                return None
+            self._parse_cache.move_to_end(version)
+
+        return _copy_parse(parsed)
+
+    def _cache_parse(
+        self, version: FileVersion, parsed: Tuple[Course, List[CourseChunk]]
+    ):
+        """Cache a parse, evicting the least recently used one when full"""
+        # Callers own and may mutate what they were given, so keep a copy
+        parsed = _copy_parse(parsed)
+        with self._cache_lock:
+            self._parse_cache[version] = parsed
+            if len(self._parse_cache) > self._parse_cache_size:
+                self._parse_cache.popitem(last=False)
+
+    def _parse_course_document(
+        self, file_path: str
+    ) -> Tuple[Course, List[CourseChunk]]:
+        """Parse a course document into a Course and its content chunks"""
         content = self.read_file(file_path)
         filename = os.path.basename(file_path)
 
@@ -116,9 +240,7 @@ class DocumentProcessor:
 
         # Parse course title from first line
         if len(lines) >= 1 and lines[0].strip():
-            title_match = re.match(
-                r"^Course Title:\s*(.+)$", lines[0].strip(), re.IGNORECASE
-            )
+            title_match = COURSE_TITLE.match(lines[0].strip())
             if title_match:
                 course_title = title_match.group(1).strip()
             else:
@@ -131,15 +253,13 @@ class DocumentProcessor:
                 continue
 
             # Try to match course link
-            link_match = re.match(r"^Course Link:\s*(.+)$", line, re.IGNORECASE)
+            link_match = COURSE_LINK.match(line)
             if link_match:
                 course_link = link_match.group(1).strip()
                 continue
 
             # Try to match instructor
-            instructor_match = re.match(
-                r"^Course Instructor:\s*(.+)$", line, re.IGNORECASE
-            )
+            instructor_match = COURSE_INSTRUCTOR.match(line)
             if instructor_match:
                 instructor_name = instructor_match.group(1).strip()
                 continue
@@ -168,10 +288,12 @@ class DocumentProcessor:
         while i < len(lines):
             line = lines[i]
 
-            # Check for lesson markers (e.g., "Lesson 0: Introduction")
-            lesson_match = re.match(
-                r"^Lesson\s+(\d+):\s*(.+)$", line.strip(), re.IGNORECASE
-            )
+            # Check for lesson markers (e.g., "Lesson 0: Introduction"); most
+            # lines are content, so a prefix check rules them out before the regex
+            if line.lstrip()[:6].lower() == "lesson":
+                lesson_match = LESSON_HEADER.match(line.strip())
+            else:
+                lesson_match = None
 
             if lesson_match:
                 # Process previous lesson if it exists
@@ -214,9 +336,7 @@ class DocumentProcessor:
                 # Check if next line is a lesson link
                 if i + 1 < len(lines):
                     next_line = lines[i + 1].strip()
-                    link_match = re.match(
-                        r"^Lesson Link:\s*(.+)$", next_line, re.IGNORECASE
-                    )
+                    link_match = LESSON_LINK.match(next_line)
                     if link_match:
                         lesson_link = link_match.group(1).strip()
                         i += 1  # Skip the link line so it's not added to content
@@ -239,14 +359,14 @@ class DocumentProcessor:
                 )
                 course.lessons.append(lesson)
 
-                chunks = self.chunk_text(lesson_text)
-                for idx, chunk in enumerate(chunks):
-                    # For any chunk of each lesson, add lesson context & course title
-
-                    chunk_with_context = f"Course {course_title} Lesson {current_lesson} content: {chunk}"
-
+                # For any chunk of each lesson, add lesson context & course title;
+                # the prefix is the same for every chunk, so format it once
+                context_prefix = (
+                    f"Course {course_title} Lesson {current_lesson} content: "
+                )
+                for chunk in self.chunk_text(lesson_text):
                     course_chunk = CourseChunk(
-                        content=chunk_with_context,
+                        content=context_prefix + chunk,
                         course_title=course.title,
                         lesson_number=current_lesson,
                         chunk_index=chunk_counter,
@@ -269,3 +389,22 @@ class DocumentProcessor:
                     chunk_counter += 1
 
         return course, course_chunks
+
+
+def _copy_parse(
+    parsed: Tuple[Course, List[CourseChunk]],
+) -> Tuple[Course, List[CourseChunk]]:
+    """Copy a parsed course, its lessons and its chunks so none are shared"""
+    course, chunks = parsed
+    lessons = [lesson.model_copy() for lesson in course.lessons]
+    return (
+        course.model_copy(update={"lessons": lessons}),
+        [chunk.model_copy() for chunk in chunks],
+    )
+
+
+def _process_in_worker(
+    chunk_size: int, chunk_overlap: int, file_path: str
+) -> Union[Tuple[Course, List[CourseChunk]], Exception]:
+    """Process one document in a worker process"""
+    return DocumentProcessor(chunk_size, chunk_overlap)._process_or_error(file_path)
@@ -1,13 +1,18 @@
 import os
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
 
+import orjson
 from ai_generator import AIGenerator
 from document_processor import DocumentProcessor
 from models import Course, CourseChunk, Lesson
 from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
+from semantic_cache import SemanticCache
 from session_manager import SessionManager
 from vector_store import VectorStore
 
+# A response source: {"display_text": ..., "lesson_link": ... or None}
+Source = Dict[str, Optional[str]]
+
 
 class RAGSystem:
     """Main orchestrator for the Retrieval-Augmented Generation system"""
@@ -23,12 +28,25 @@ class RAGSystem:
             config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
         )
         self.ai_generator = AIGenerator(
-            config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL
+            config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL, config.PROMPT_CACHE_TTL
         )
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
+        # Serialized analytics and the catalog version they were built from
+        self._analytics_json: Optional[Tuple[int, bytes]] = None
+
+        # Cache answers for repeated questions, reusing the store's embedder
+        self.response_cache = SemanticCache(
+            self.vector_store.embedding_function,
+            threshold=config.SEMANTIC_CACHE_THRESHOLD,
+            max_entries=config.SEMANTIC_CACHE_SIZE,
+            ttl=config.SEMANTIC_CACHE_TTL,
+        )
+        # Catalog version the cached answers were built from
+        self._response_cache_version = self.vector_store.catalog_version
+
         # Initialize search tools
-        self.tool_manager = ToolManager()
+        self.tool_manager = ToolManager(config.PROMPT_CACHE_TTL)
         self.search_tool = CourseSearchTool(self.vector_store)
         self.outline_tool = CourseOutlineTool(self.vector_store)
         self.tool_manager.register_tool(self.search_tool)
@@ -89,39 +107,47 @@ class RAGSystem:
         # Get existing course titles to avoid re-processing
         existing_course_titles = set(self.vector_store.get_existing_course_titles())
 
-        # Process each file in the folder
+        # Collect the course documents in the folder
+        file_paths = []
         for file_name in os.listdir(folder_path):
             file_path = os.path.join(folder_path, file_name)
             if os.path.isfile(file_path) and file_name.lower().endswith(
                 (".pdf", ".docx", ".txt")
             ):
-                try:
-                    # Check if this course might already exist
-                    # We'll process the document to get the course ID, but only add if new
-                    course, course_chunks = (
-                        self.document_processor.process_course_document(file_path)
-                    )
+                file_paths.append(file_path)
 
-                    if course and course.title not in existing_course_titles:
-                        # This is a new course - add it to the vector store
-                        self.vector_store.add_course_metadata(course)
-                        self.vector_store.add_course_content(course_chunks)
-                        total_courses += 1
-                        total_chunks += len(course_chunks)
-                        print(
-                            f"Added new course: {course.title} ({len(course_chunks)} chunks)"
-                        )
-                        existing_course_titles.add(course.title)
-                    elif course:
-                        print(f"Course already exists: {course.title} - skipping")
-                except Exception as e:
-                    print(f"Error processing {file_name}: {e}")
+        # Parse the documents together, in parallel for big batches; the course
+        # title is only known after parsing, so existing courses are skipped after
+        processed = self.document_processor.process_many(file_paths)
+
+        for file_path, outcome in zip(file_paths, processed):
+            file_name = os.path.basename(file_path)
+            if isinstance(outcome, Exception):
+                print(f"Error processing {file_name}: {outcome}")
+                continue
+
+            course, course_chunks = outcome
+            try:
+                if course and course.title not in existing_course_titles:
+                    # This is a new course - add it to the vector store
+                    self.vector_store.add_course_metadata(course)
+                    self.vector_store.add_course_content(course_chunks)
+                    total_courses += 1
+                    total_chunks += len(course_chunks)
+                    print(
+                        f"Added new course: {course.title} ({len(course_chunks)} chunks)"
+                    )
+                    existing_course_titles.add(course.title)
+                elif course:
+                    print(f"Course already exists: {course.title} - skipping")
+            except Exception as e:
+                print(f"Error processing {file_name}: {e}")
 
         return total_courses, total_chunks
 
     def query(
         self, query: str, session_id: Optional[str] = None
-    ) -> Tuple[str, List[str]]:
+    ) -> Tuple[str, List[Source]]:
         """
         Process a user query using the RAG system with tool-based search.
 
@@ -132,6 +158,96 @@ class RAGSystem:
         Returns:
             Tuple of (response, sources list - empty for tool-based approach)
         """
+        # Start this request with its own source tracking
+        self.tool_manager.reset_sources()
+
+        cached, generation_args = self._prepare_query(query, session_id)
+        if cached is not None:
+            return cached
+
+        # Generate response using AI with sequential tool support
+        response = self.ai_generator.generate_response(**generation_args)
+
+        return self._finish_query(query, session_id, generation_args, response)
+
+    def query_cached(
+        self, query: str, session_id: Optional[str] = None
+    ) -> Optional[Tuple[str, List[Source]]]:
+        """
+        Answer an exact repeat of a standalone query from the response cache.
+
+        Only dict lookups, never an embedding or vector search, so this is
+        cheap enough to call on the event loop before streaming a response.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Returns:
+            Tuple of (response, sources list), or None if not cached
+        """
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+        return self._cached_answer(
+            query, session_id, history, self.response_cache.get_exact
+        )
+
+    def query_stream(
+        self, query: str, session_id: Optional[str] = None
+    ) -> Generator[str, None, List[Source]]:
+        """
+        Process a user query, streaming the response text as it is generated.
+
+        Sources are tracked in the caller's context, so the returned generator
+        may be advanced from worker threads.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Returns:
+            Generator yielding text deltas and returning the sources list
+        """
+        self.tool_manager.reset_sources()
+        return self._stream_query(query, session_id)
+
+    def _stream_query(
+        self, query: str, session_id: Optional[str]
+    ) -> Generator[str, None, List[Source]]:
+        """Yield response text, then cache the answer and record the exchange"""
+        cached, generation_args = self._prepare_query(query, session_id)
+        if cached is not None:
+            response, sources = cached
+            yield response
+            return sources
+
+        chunks = []
+        try:
+            for text in self.ai_generator.stream_response(**generation_args):
+                chunks.append(text)
+                yield text
+        except Exception:
+            # Record what was sent before the failure, but never cache it
+            self._finish_query(
+                query, session_id, generation_args, "".join(chunks), cache=False
+            )
+            raise
+
+        _, sources = self._finish_query(
+            query, session_id, generation_args, "".join(chunks)
+        )
+        return sources
+
+    def _prepare_query(
+        self, query: str, session_id: Optional[str]
+    ) -> Tuple[Optional[Tuple[str, List[Source]]], Dict[str, Any]]:
+        """
+        Look up a cached answer and build the generation arguments for a query.
+
+        Returns:
+            Tuple of (cached (response, sources) or None, generate_response kwargs)
+        """
         # Create prompt for the AI with clear instructions
         prompt = f"""Answer this question about course materials: {query}"""
 
@@ -140,27 +256,90 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
 
-        # Generate response using AI with sequential tool support
-        response = self.ai_generator.generate_response(
-            query=prompt,
-            conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager,
-            max_rounds=self.config.MAX_TOOL_ROUNDS,
+        cached = self._cached_answer(
+            query, session_id, history, self.response_cache.get
         )
+        if cached is not None:
+            return cached, {}
 
+        # Send tools only when the question could be about course content;
+        # follow-ups always get them since they may refer back to a course
+        tools = None
+        if history is not None or self._is_course_query(query):
+            tools = self.tool_manager.get_tool_definitions()
+
+        return None, {
+            "query": prompt,
+            "conversation_history": history,
+            "tools": tools,
+            "tool_manager": self.tool_manager if tools else None,
+            "max_rounds": self.config.MAX_TOOL_ROUNDS,
+        }
+
+    def _cached_answer(
+        self,
+        query: str,
+        session_id: Optional[str],
+        history: Optional[str],
+        lookup: Callable[[str], Optional[Tuple[str, List[Source]]]],
+    ) -> Optional[Tuple[str, List[Source]]]:
+        """Return a cached answer for a standalone query and record the exchange"""
+        # Follow-up questions depend on history, so only cache standalone ones
+        if history is not None:
+            return None
+
+        # Answers built from an older catalog may miss newly added courses
+        version = self.vector_store.catalog_version
+        if self._response_cache_version != version:
+            self.response_cache.clear()
+            self._response_cache_version = version
+
+        cached = lookup(query)
+        if cached is None:
+            return None
+
+        response, sources = cached
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+        return response, list(sources)
+
+    def _finish_query(
+        self,
+        query: str,
+        session_id: Optional[str],
+        generation_args: Dict[str, Any],
+        response: str,
+        cache: bool = True,
+    ) -> Tuple[str, List[Source]]:
+        """Collect sources, cache the answer and record the exchange"""
         # Get sources from all tool calls in this session
         sources = self.tool_manager.get_all_sources_from_session()
 
         # Reset sources after retrieving them
         self.tool_manager.reset_sources()
 
+        if cache and generation_args["conversation_history"] is None:
+            self.response_cache.put(query, (response, sources))
+
         # Update conversation history
-        if session_id:
+        if session_id and response:
             self.session_manager.add_exchange(session_id, query, response)
 
         # Return response with sources from tool searches
-        return response, sources
+        return response, list(sources)
+
+    def _is_course_query(self, query: str) -> bool:
+        """Check whether a standalone query is close enough to the courses"""
+        # The response cache has usually embedded this query already
+        similarity = self.vector_store.max_course_similarity(
+            query, self.response_cache.embed(query)
+        )
+
+        # Fall back to offering tools when relevance can't be scored
+        if similarity is None:
+            return True
+
+        return similarity >= self.config.TOOL_ROUTING_THRESHOLD
 
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
@@ -168,3 +347,16 @@ class RAGSystem:
             "total_courses": self.vector_store.get_course_count(),
             "course_titles": self.vector_store.get_existing_course_titles(),
         }
+
+    def get_course_analytics_json(self) -> bytes:
+        """Get course analytics as JSON, reused until the catalog changes"""
+        version = self.vector_store.catalog_version
+        cached = self._analytics_json
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # Tagged with the version read before building, so a concurrent
+        # catalog change makes the next call rebuild
+        payload = orjson.dumps(self.get_course_analytics())
+        self._analytics_json = (version, payload)
+        return payload
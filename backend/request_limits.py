@@ -0,0 +1,71 @@
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Methods whose request bodies the API reads
+BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
+
+class RequestLimitMiddleware:
+    """Reject oversized or non-JSON API request bodies before routing"""
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int, path_prefix: str = "/api/"):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in BODY_METHODS
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        # One pass over the raw headers; ASGI servers lowercase their names
+        content_length = 0
+        content_type = b""
+        chunked = False
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit():
+                content_length = int(value)
+            elif name == b"content-type":
+                content_type = value
+            elif name == b"transfer-encoding":
+                chunked = True
+
+        if content_length > self.max_body_bytes:
+            response = JSONResponse({"detail": "Request body too large"}, 413)
+        elif (content_length or chunked) and (
+            content_type.split(b";", 1)[0].strip().lower() != b"application/json"
+        ):
+            response = JSONResponse(
+                {"detail": "Content-Type must be application/json"}, 415
+            )
+        else:
+            await self.app(scope, self._limit_body(receive), send)
+            return
+
+        await response(scope, receive, send)
+
+    def _limit_body(self, receive: Receive) -> Receive:
+        """
+        Wrap receive to enforce the size limit on bodies as they arrive.
+
+        Chunked bodies carry no Content-Length, and a declared length can
+        understate the real body, so the bytes actually received are counted.
+        The HTTPException reaches FastAPI's exception handling as a 413.
+        """
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise HTTPException(413, "Request body too large")
+            return message
+
+        return receive_limited
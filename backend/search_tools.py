@@ -1,7 +1,19 @@
+import json
+import threading
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, Protocol
+from collections import deque
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Protocol, Set, Tuple
 
-from vector_store import SearchResults, VectorStore
+from vector_store import TRANSIENT_STORE_ERRORS, SearchResults, VectorStore
+
+# Per-request source log, its seen (display, link) keys and the latest sources
+SessionState = Tuple[Deque[dict], Set[tuple], List[dict]]
+
+
+class TransientToolError(Exception):
+    """Raised by a tool when its backend is temporarily unavailable"""
 
 
 class Tool(ABC):
@@ -18,12 +30,32 @@ class Tool(ABC):
         pass
 
 
-class CourseSearchTool(Tool):
+class SourceTrackingTool(Tool):
+    """Tool that records the sources of its last call in the caller's context"""
+
+    def __init__(self):
+        # Context-local, so concurrent calls each read back their own sources
+        self._last_sources: ContextVar[Optional[list]] = ContextVar(
+            f"{type(self).__name__}_last_sources", default=None
+        )
+
+    @property
+    def last_sources(self) -> list:
+        """Sources from this tool's last call in the current context"""
+        sources = self._last_sources.get()
+        return sources if sources is not None else []
+
+    @last_sources.setter
+    def last_sources(self, sources: list):
+        self._last_sources.set(sources)
+
+
+class CourseSearchTool(SourceTrackingTool):
     """Tool for searching course content with semantic course name matching"""
 
     def __init__(self, vector_store: VectorStore):
+        super().__init__()
         self.store = vector_store
-        self.last_sources = []  # Track sources from last search
 
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
@@ -69,9 +101,12 @@ class CourseSearchTool(Tool):
         """
 
         # Use the vector store's unified search interface
-        results = self.store.search(
-            query=query, course_name=course_name, lesson_number=lesson_number
-        )
+        try:
+            results = self.store.search(
+                query=query, course_name=course_name, lesson_number=lesson_number
+            )
+        except TRANSIENT_STORE_ERRORS as e:
+            raise TransientToolError(f"Search backend unavailable: {e}") from e
 
         # Handle errors
         if results.error:
@@ -91,47 +126,108 @@ class CourseSearchTool(Tool):
 
     def _format_results(self, results: SearchResults) -> str:
         """Format search results with course and lesson context"""
-        formatted = []
+        parts = []
         sources = []  # Track sources for the UI with lesson links
+        lesson_links = {}  # Results often share a lesson, so look each up once
+
+        # Load links for every course in the results with one catalog read
+        self.store.prefetch_course_links(
+            {
+                meta.get("course_title")
+                for meta in results.metadata
+                if meta.get("lesson_number") is not None
+                and meta.get("course_title", "unknown") != "unknown"
+            }
+        )
 
         for doc, meta in zip(results.documents, results.metadata):
             course_title = meta.get("course_title", "unknown")
             lesson_num = meta.get("lesson_number")
 
-            # Build context header
-            header = f"[{course_title}"
-            if lesson_num is not None:
-                header += f" - Lesson {lesson_num}"
-            header += "]"
-
-            # Build source with link information
-            source_display = course_title
-            if lesson_num is not None:
-                source_display += f" - Lesson {lesson_num}"
-
-            # Try to get lesson link if lesson number exists
-            lesson_link = None
-            if lesson_num is not None and course_title != "unknown":
-                lesson_link = self.store.get_lesson_link(course_title, lesson_num)
+            if lesson_num is None:
+                source_display = course_title
+                lesson_link = None
+            else:
+                source_display = f"{course_title} - Lesson {lesson_num}"
+
+                # Try to get lesson link if lesson number exists
+                key = (course_title, lesson_num)
+                if key not in lesson_links:
+                    lesson_links[key] = (
+                        self.store.get_lesson_link(course_title, lesson_num)
+                        if course_title != "unknown"
+                        else None
+                    )
+                lesson_link = lesson_links[key]
 
             # Create structured source data
-            source_data = {"display_text": source_display, "lesson_link": lesson_link}
-            sources.append(source_data)
+            sources.append({"display_text": source_display, "lesson_link": lesson_link})
 
-            formatted.append(f"{header}\n{doc}")
+            # Context header followed by the document, built in one join
+            parts.extend(("[", source_display, "]\n", doc, "\n\n"))
 
         # Store structured sources for retrieval
         self.last_sources = sources
 
-        return "\n\n".join(formatted)
+        # Drop the separator after the last result
+        return "".join(parts[:-1])
 
 
 class ToolManager:
     """Manages available tools for the AI"""
 
-    def __init__(self):
+    def __init__(self, cache_ttl: str = "5m", max_sources: int = 200):
         self.tools = {}
-        self.session_sources = []  # Accumulate sources across rounds
+        # Sources accumulated across rounds, the (display, link) keys seen and
+        # the latest tool call's sources, kept per request context so
+        # concurrent queries don't mix sources
+        self._session_sources: ContextVar[SessionState] = ContextVar("session_sources")
+        self._sources_lock = threading.Lock()
+        self.max_sources = max_sources  # Oldest sources drop beyond this
+        self.cache_ttl = cache_ttl  # Prompt cache lifetime for tool definitions
+        self.tool_definitions = {}  # Tool name -> definition, built on registration
+        self.has_sources = {}  # Tool name -> whether the tool tracks last_sources
+        self._definitions = []  # Frozen definitions list sent with every request
+        self._source_tools = []  # Registered tools that track last_sources
+
+    @property
+    def session_sources(self) -> Deque[dict]:
+        """Sources accumulated by tool calls in the current request context"""
+        return self._session_state()[0]
+
+    def _session_state(self) -> SessionState:
+        """Get this context's source log, seen source keys and latest sources"""
+        state = self._session_sources.get(None)
+        if state is None:
+            state = self._new_session_state()
+            self._session_sources.set(state)
+        return state
+
+    def _new_session_state(self) -> SessionState:
+        """Create an empty, bounded source log"""
+        return deque(maxlen=self.max_sources), set(), []
+
+    def _add_session_sources(self, sources: list):
+        """Record sources for this request, skipping ones already recorded"""
+        session_sources, seen, last_sources = self._session_state()
+
+        # Parallel tools in one request share the log, so check-and-add is locked.
+        # Tools run in copied contexts, so the latest sources are updated in place
+        with self._sources_lock:
+            last_sources[:] = sources
+            for source in sources:
+                key = (source.get("display_text"), source.get("lesson_link"))
+                if key in seen:
+                    continue
+
+                if len(session_sources) == self.max_sources:
+                    evicted = session_sources.popleft()
+                    seen.discard(
+                        (evicted.get("display_text"), evicted.get("lesson_link"))
+                    )
+
+                seen.add(key)
+                session_sources.append(source)
 
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -140,50 +236,84 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        self.tool_definitions[tool_name] = tool_def
+        self.has_sources[tool_name] = hasattr(tool, "last_sources")
+        self._definitions = self._build_definitions()
+        self._source_tools = [
+            tool for name, tool in self.tools.items() if self.has_sources[name]
+        ]
+
+    def _build_definitions(self) -> list:
+        """Build the definitions list with a cache breakpoint on the last tool"""
+        definitions = list(self.tool_definitions.values())
+
+        # Cache breakpoint on the last tool caches every tool definition
+        if definitions:
+            definitions[-1] = {
+                **definitions[-1],
+                "cache_control": {"type": "ephemeral", "ttl": self.cache_ttl},
+            }
+
+        return definitions
 
     def get_tool_definitions(self) -> list:
         """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        # Same list every call, so the tools prefix serializes identically
+        return self._definitions
 
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
-        if tool_name not in self.tools:
+        tool = self.tools.get(tool_name)
+        if tool is None:
             return f"Tool '{tool_name}' not found"
 
-        result = self.tools[tool_name].execute(**kwargs)
+        result = tool.execute(**kwargs)
+        if not self.has_sources[tool_name]:
+            return result
 
-        # Accumulate sources from this tool call
-        if hasattr(self.tools[tool_name], "last_sources"):
-            self.session_sources.extend(self.tools[tool_name].last_sources)
+        # Accumulate sources from this tool call; read in the same context
+        # as execute, so concurrent calls never see each other's sources
+        sources = tool.last_sources
+        if sources:
+            self._add_session_sources(sources)
 
         return result
 
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
-        # Check all tools for last_sources attribute
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources") and tool.last_sources:
-                return tool.last_sources
-        return []
+        return list(self._session_state()[2])
 
-    def get_all_sources_from_session(self) -> list:
-        """Get all sources accumulated during the current session"""
-        return self.session_sources.copy()
+    def get_all_sources_from_session(self) -> tuple:
+        """Get a snapshot of all unique sources accumulated during the session"""
+        return tuple(self.session_sources)
 
     def reset_sources(self):
         """Reset all source tracking"""
-        self.session_sources = []
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources"):
-                tool.last_sources = []
+        self._session_sources.set(self._new_session_state())
+        for tool in self._source_tools:
+            tool.last_sources = []
+
 
+@lru_cache(maxsize=512)
+def _format_lesson_list(lessons_json: str) -> str:
+    """Parse and format a course's lessons, cached by the raw metadata string"""
+    try:
+        lessons = json.loads(lessons_json)
+    except json.JSONDecodeError:
+        return ""
 
-class CourseOutlineTool(Tool):
+    return "\n".join(
+        f"  Lesson {lesson.get('lesson_number', '')}: {lesson.get('lesson_title', '')}"
+        for lesson in lessons
+    )
+
+
+class CourseOutlineTool(SourceTrackingTool):
     """Tool for getting course outlines with lesson structure"""
 
     def __init__(self, vector_store: VectorStore):
+        super().__init__()
         self.store = vector_store
-        self.last_sources = []
 
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
@@ -231,19 +361,11 @@ class CourseOutlineTool(Tool):
 
     def _format_outline(self, metadata: Dict[str, Any]) -> str:
         """Format course outline from metadata"""
-        import json
-
         title = metadata.get("title", "Unknown Course")
         course_link = metadata.get("course_link", "")
         instructor = metadata.get("instructor", "")
         lessons_json = metadata.get("lessons_json", "[]")
 
-        # Parse lessons
-        try:
-            lessons = json.loads(lessons_json)
-        except json.JSONDecodeError:
-            lessons = []
-
         # Format output
         outline = [f"Course: {title}"]
 
@@ -253,12 +375,10 @@ class CourseOutlineTool(Tool):
         if course_link:
             outline.append(f"Course Link: {course_link}")
 
-        if lessons:
+        lesson_list = _format_lesson_list(lessons_json)
+        if lesson_list:
             outline.append("\nLessons:")
-            for lesson in lessons:
-                lesson_num = lesson.get("lesson_number", "")
-                lesson_title = lesson.get("lesson_title", "")
-                outline.append(f"  Lesson {lesson_num}: {lesson_title}")
+            outline.append(lesson_list)
         else:
             outline.append("\nNo lessons found")
 
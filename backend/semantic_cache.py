@@ -0,0 +1,165 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+# Numbers and capitalized words after the first one: lesson numbers, course
+# and product names. Embeddings barely move when these change, so similar
+# queries must also agree on them to share an answer.
+SPECIFIC_TOKENS = re.compile(r"\d+|(?<!^)\b[A-Z]\w*")
+
+
+def query_specifics(query: str) -> FrozenSet[str]:
+    """Get the numbers and names a cached answer must match"""
+    return frozenset(SPECIFIC_TOKENS.findall(query))
+
+
+class SemanticCache:
+    """LRU response cache for repeated queries, optionally matching similar ones"""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Any],
+        threshold: Optional[float] = None,
+        max_entries: int = 10000,
+        ttl: float = 300,
+    ):
+        self.embed_fn = embed_fn  # Maps a list of texts to a list of vectors
+        # Minimum cosine similarity for a near-duplicate hit; None only
+        # matches exact repeats
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl  # Seconds before an entry goes stale
+
+        # Query -> slot index, ordered from least to most recently used
+        self.slots: "OrderedDict[str, int]" = OrderedDict()
+        # Per-slot (query, payload, stored_at, specifics), parallel to rows below
+        self.entries: List[Optional[Tuple[str, Any, float, FrozenSet[str]]]] = [
+            None
+        ] * max_entries
+        self.embeddings: Optional[np.ndarray] = None  # Allocated on first put
+        self.stored_at = np.zeros(max_entries)
+        self.valid = np.zeros(max_entries, dtype=bool)
+        # Recent query vectors, so a miss embeds once for get, routing and put
+        self.recent_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.recent_vectors_size = 64
+        self.lock = threading.Lock()
+
+    def get(self, query: str) -> Optional[Any]:
+        """Return the cached payload for this or a near-identical query"""
+        with self.lock:
+            # Fast path: exact string match skips the embedding entirely
+            slot = self.slots.get(query)
+            if slot is not None:
+                return self._hit(query, slot)
+
+            if self.threshold is None or not self.slots:
+                return None
+
+        query_vector = self.embed(query)
+        specifics = query_specifics(query)
+
+        with self.lock:
+            if self.embeddings is None:
+                return None
+
+            # One matrix-vector product scores every cached query; stale
+            # entries are masked so they can't shadow a live match
+            similarities = self.embeddings @ query_vector
+            expired = time.monotonic() - self.stored_at > self.ttl
+            similarities[~self.valid | expired] = -1.0
+
+            # Best first among the few entries above the threshold
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            for slot in candidates[np.argsort(-similarities[candidates])]:
+                cached_query, _, _, cached_specifics = self.entries[slot]
+                if cached_specifics == specifics:
+                    return self._hit(cached_query, int(slot))
+
+            return None
+
+    def get_exact(self, query: str) -> Optional[Any]:
+        """Return the cached payload for this exact query, never embedding it"""
+        with self.lock:
+            slot = self.slots.get(query)
+            return None if slot is None else self._hit(query, slot)
+
+    def put(self, query: str, payload: Any):
+        """Cache a payload for a query, evicting the least recently used entry"""
+        # Exact-match caches never compare embeddings, so don't compute them
+        query_vector = None if self.threshold is None else self.embed(query)
+        specifics = query_specifics(query)
+
+        with self.lock:
+            if query_vector is not None and self.embeddings is None:
+                self.embeddings = np.zeros(
+                    (self.max_entries, query_vector.shape[0]), dtype=np.float32
+                )
+
+            if query in self.slots:
+                slot = self.slots.pop(query)
+            elif len(self.slots) >= self.max_entries:
+                _, slot = self.slots.popitem(last=False)
+            else:
+                slot = len(self.slots)
+
+            self.slots[query] = slot
+            if query_vector is not None:
+                self.embeddings[slot] = query_vector
+            stored_at = time.monotonic()
+            self.entries[slot] = (query, payload, stored_at, specifics)
+            self.stored_at[slot] = stored_at
+            self.valid[slot] = True
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self.lock:
+            self.slots.clear()
+            self.entries = [None] * self.max_entries
+            self.valid[:] = False
+
+    def _hit(self, query: str, slot: int) -> Optional[Any]:
+        """Return a live payload and mark it recently used; expire stale ones"""
+        _, payload, stored_at, _ = self.entries[slot]
+        if time.monotonic() - stored_at > self.ttl:
+            # Stale entries free their slot for reuse by the next put
+            self._remove(query, slot)
+            return None
+
+        self.slots.move_to_end(query)
+        return payload
+
+    def _remove(self, query: str, slot: int):
+        """Remove an entry, moving the last slot into its place"""
+        del self.slots[query]
+        last_slot = len(self.slots)
+        if slot != last_slot:
+            self.slots[self.entries[last_slot][0]] = slot
+            if self.embeddings is not None:
+                self.embeddings[slot] = self.embeddings[last_slot]
+            self.stored_at[slot] = self.stored_at[last_slot]
+            self.entries[slot] = self.entries[last_slot]
+        self.entries[last_slot] = None
+        self.valid[last_slot] = False
+
+    def embed(self, query: str) -> np.ndarray:
+        """Embed a query as a unit vector so dot products are cosine similarity"""
+        with self.lock:
+            vector = self.recent_vectors.get(query)
+            if vector is not None:
+                self.recent_vectors.move_to_end(query)
+                return vector
+
+        vector = np.asarray(self.embed_fn([query])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+
+        with self.lock:
+            self.recent_vectors[query] = vector
+            if len(self.recent_vectors) > self.recent_vectors_size:
+                self.recent_vectors.popitem(last=False)
+        return vector
@@ -5,17 +5,16 @@ This module provides common fixtures and test utilities used across
 all test files in the backend test suite.
 """
 
+import asyncio
+import orjson
 import pytest
 import sys
 import os
-import tempfile
-import shutil
 from unittest.mock import Mock, patch, MagicMock
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import Dict, Any, Optional
 from fastapi.testclient import TestClient
-from httpx import AsyncClient
-import asyncio
+from httpx import ASGITransport, AsyncClient
 
 # Add backend to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -34,23 +33,19 @@ class MockConfig:
     CHUNK_OVERLAP: int = 100
     MAX_RESULTS: int = 5
     MAX_HISTORY: int = 2
+    MAX_TOOL_ROUNDS: int = 2
+    TOOL_ROUTING_THRESHOLD: float = 0.2
+    PROMPT_CACHE_TTL: str = "5m"
+    SEMANTIC_CACHE_THRESHOLD: Optional[float] = None
+    SEMANTIC_CACHE_SIZE: int = 100
+    SEMANTIC_CACHE_TTL: int = 300
     CHROMA_PATH: str = "./test_chroma"
 
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for the test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
-
-
 @pytest.fixture
-def temp_dir():
-    """Create temporary directory for test data"""
-    temp_dir = tempfile.mkdtemp()
-    yield temp_dir
-    shutil.rmtree(temp_dir, ignore_errors=True)
+def temp_dir(tmp_path):
+    """Provide a temporary directory for test data, cleaned up by pytest"""
+    return str(tmp_path)
 
 
 @pytest.fixture
@@ -125,44 +120,96 @@ def sample_course_stats():
     }
 
 
-@pytest.fixture
-def mock_rag_system():
-    """Create a mock RAG system for API testing"""
+# Canned RAG system results, shared read-only across tests
+DEFAULT_QUERY_RESULT = (
+    "Machine learning is a subset of artificial intelligence that enables computers to learn and make decisions from data without being explicitly programmed.",
+    (
+        {
+            "display_text": "Test Course - Lesson 0: Introduction",
+            "lesson_link": "https://example.com/lesson0"
+        },
+    )
+)
+DEFAULT_COURSE_ANALYTICS = {
+    "total_courses": 2,
+    "course_titles": ("Test Course", "Advanced ML Course")
+}
+
+
+@pytest.fixture(scope="session")
+def shared_rag_system():
+    """Create the RAG system mock behind the session-wide test app"""
     mock_rag = Mock()
     mock_rag.session_manager = Mock()
+    return mock_rag
+
+
+def stream_answer(answer: str, sources, error: Exception = None):
+    """Build a query_stream side effect yielding the answer in two deltas"""
+    def query_stream(query, session_id=None):
+        middle = len(answer) // 2
+        yield answer[:middle]
+        if error is not None:
+            raise error
+        yield answer[middle:]
+        return list(sources)
+
+    return query_stream
+
+
+@pytest.fixture
+def mock_rag_system(shared_rag_system):
+    """Reset the shared RAG system mock to its default responses"""
+    mock_rag = shared_rag_system
+    mock_rag.reset_mock(return_value=True, side_effect=True)
     mock_rag.session_manager.create_session.return_value = "test_session_123"
     
-    mock_rag.query.return_value = (
-        "Machine learning is a subset of artificial intelligence that enables computers to learn and make decisions from data without being explicitly programmed.",
-        [
-            {
-                "display_text": "Test Course - Lesson 0: Introduction",
-                "lesson_link": "https://example.com/lesson0"
-            }
-        ]
+    mock_rag.query_cached.return_value = None
+    mock_rag.query_stream.side_effect = stream_answer(*DEFAULT_QUERY_RESULT)
+    mock_rag.get_course_analytics.return_value = DEFAULT_COURSE_ANALYTICS
+    mock_rag.get_course_analytics_json.side_effect = lambda: orjson.dumps(
+        mock_rag.get_course_analytics()
     )
-    
-    mock_rag.get_course_analytics.return_value = {
-        "total_courses": 2,
-        "course_titles": ["Test Course", "Advanced ML Course"]
-    }
-    
     return mock_rag
 
 
 @pytest.fixture
-def test_app(mock_rag_system, temp_dir):
+def set_query_result(mock_rag_system):
+    """Set the answer and sources the RAG system mock streams, or a failure"""
+    def set_result(answer: str, sources, error: Exception = None):
+        mock_rag_system.query_stream.side_effect = stream_answer(answer, sources, error)
+
+    return set_result
+
+
+@pytest.fixture(scope="session")
+def test_app(shared_rag_system):
     """Create a test FastAPI application without static file mounting"""
-    from fastapi import FastAPI, HTTPException
+    mock_rag_system = shared_rag_system
+    from api_schemas import (
+        CourseStats,
+        QueryRequest,
+        QueryResponse,
+        json_body,
+        stream_query_response,
+    )
+    from fastapi import Depends, FastAPI, HTTPException
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.middleware.trustedhost import TrustedHostMiddleware
-    from pydantic import BaseModel
-    from typing import List, Optional
+    from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+    from itertools import chain
+    from request_limits import RequestLimitMiddleware
+    from starlette.concurrency import run_in_threadpool
     
     # Create test app
-    app = FastAPI(title="Course Materials RAG System - Test", root_path="")
+    app = FastAPI(
+        title="Course Materials RAG System - Test",
+        root_path="",
+        default_response_class=ORJSONResponse,
+    )
     
     # Add middleware
+    app.add_middleware(RequestLimitMiddleware, max_body_bytes=1_000_000)
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
     app.add_middleware(
         CORSMiddleware,
@@ -173,51 +220,26 @@ def test_app(mock_rag_system, temp_dir):
         expose_headers=["*"],
     )
     
-    # Pydantic models
-    class QueryRequest(BaseModel):
-        query: str
-        session_id: Optional[str] = None
-    
-    class SourceData(BaseModel):
-        display_text: str
-        lesson_link: Optional[str] = None
-    
-    class QueryResponse(BaseModel):
-        answer: str
-        sources: List[SourceData]
-        session_id: str
-    
-    class CourseStats(BaseModel):
-        total_courses: int
-        course_titles: List[str]
-    
-    # API endpoints - inline definitions to avoid import issues
+    # API endpoints - app.py builds a real RAGSystem on import, so its routes
+    # are repeated here around the shared request and response helpers
     @app.post("/api/query", response_model=QueryResponse)
-    async def query_documents(request: QueryRequest):
+    async def query_documents(request: QueryRequest = Depends(json_body(QueryRequest))):
         try:
             session_id = request.session_id
             if not session_id:
                 session_id = mock_rag_system.session_manager.create_session()
             
-            answer, sources = mock_rag_system.query(request.query, session_id)
-            
-            source_data_list = []
-            for source in sources:
-                if isinstance(source, dict):
-                    source_data_list.append(SourceData(
-                        display_text=source.get('display_text', ''),
-                        lesson_link=source.get('lesson_link')
-                    ))
-                else:
-                    source_data_list.append(SourceData(
-                        display_text=str(source),
-                        lesson_link=None
-                    ))
+            cached = mock_rag_system.query_cached(request.query, session_id)
+            if cached is not None:
+                answer, sources = cached
+                return QueryResponse(answer=answer, sources=sources, session_id=session_id)
             
-            return QueryResponse(
-                answer=answer,
-                sources=source_data_list,
-                session_id=session_id
+            fragments = stream_query_response(
+                mock_rag_system.query_stream(request.query, session_id), session_id
+            )
+            first = await run_in_threadpool(next, fragments)
+            return StreamingResponse(
+                chain((first,), fragments), media_type="application/json"
             )
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -225,11 +247,8 @@ def test_app(mock_rag_system, temp_dir):
     @app.get("/api/courses", response_model=CourseStats)
     async def get_course_stats():
         try:
-            analytics = mock_rag_system.get_course_analytics()
-            return CourseStats(
-                total_courses=analytics["total_courses"],
-                course_titles=analytics["course_titles"]
-            )
+            payload = await run_in_threadpool(mock_rag_system.get_course_analytics_json)
+            return Response(payload, media_type="application/json")
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
     
@@ -240,30 +259,89 @@ def test_app(mock_rag_system, temp_dir):
     return app
 
 
-@pytest.fixture
-def test_client(test_app):
-    """Create a test client for the FastAPI application"""
+@pytest.fixture(scope="session")
+def shared_test_client(test_app):
+    """Create one test client so the app and its routes are built once"""
     return TestClient(test_app)
 
 
-# Async test client removed for now due to pytest-asyncio configuration issues
+@pytest.fixture
+def test_client(shared_test_client, mock_rag_system):
+    """Provide the shared test client with a freshly reset RAG system mock"""
+    return shared_test_client
 
 
-class MockContent:
-    """Mock content for AI responses"""
-    def __init__(self, type: str, text: str = None, id: str = None, name: str = None, input: dict = None):
-        self.type = type
-        self.text = text
-        self.id = id
-        self.name = name
-        self.input = input
+@pytest.fixture
+async def async_client(test_app, mock_rag_system):
+    """Create an async client that calls the app in-process, without threads"""
+    transport = ASGITransport(app=test_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
 
+@dataclass
+class ASGIResponse:
+    """Response captured from a direct ASGI call"""
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def content(self) -> bytes:
+        return self.body
+
+    def json(self) -> Any:
+        return orjson.loads(self.body)
+
+
+@pytest.fixture
+def asgi_call(test_app, mock_rag_system):
+    """Call the test app as an ASGI callable, skipping HTTP client encoding"""
+    async def call(method: str, path: str, json_body: Any = None) -> ASGIResponse:
+        headers = [(b"host", b"test")]
+        request = {"type": "http.request", "body": b"", "more_body": False}
+        if json_body is not None:
+            headers.append((b"content-type", b"application/json"))
+            request["body"] = orjson.dumps(json_body)
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": headers,
+            "server": ("test", 80),
+            "client": ("127.0.0.1", 12345),
+        }
+        pending = [request]
+        sent = []
+        complete = asyncio.Event()
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            # Only report a disconnect once the response is fully sent
+            await complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                complete.set()
+
+        await test_app(scope, receive, send)
+        return ASGIResponse(
+            status_code=sent[0]["status"],
+            headers={k.decode().lower(): v.decode() for k, v in sent[0]["headers"]},
+            body=b"".join(message.get("body", b"") for message in sent[1:]),
+        )
 
-class MockResponse:
-    """Mock response for AI API calls"""
-    def __init__(self, content: List[MockContent], stop_reason: str = "end_turn"):
-        self.content = content
-        self.stop_reason = stop_reason
+    return call
 
 
 @pytest.fixture
@@ -6,29 +6,34 @@ This script performs comprehensive diagnostics to identify why the RAG chatbot
 returns "query failed" for content-related questions.
 """
 
-import json
+import io
 import os
 import sys
+import threading
 import traceback
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
 
 # Add backend to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import all the system components
+# Only config is needed up front; each check imports the components it
+# exercises so a missing dependency fails that check instead of the script
 try:
-    from ai_generator import AIGenerator
     from config import config
-    from document_processor import DocumentProcessor
-    from models import Course, CourseChunk, Lesson
-    from rag_system import RAGSystem
-    from search_tools import CourseSearchTool, ToolManager
-    from session_manager import SessionManager
-    from vector_store import VectorStore
 except ImportError as e:
     print(f"❌ Import error: {e}")
     sys.exit(1)
 
+if TYPE_CHECKING:
+    from rag_system import RAGSystem
+    from vector_store import VectorStore
+
+# Resolved from this file so the check works from any working directory
+_DOCS_PATH = Path(__file__).resolve().parent.parent.parent / "docs"
+_DOC_SUFFIXES = frozenset({".txt", ".pdf", ".docx"})
+
 
 class SystemDiagnostics:
     """Comprehensive system diagnostics"""
@@ -37,30 +42,89 @@ class SystemDiagnostics:
         self.issues = []
         self.warnings = []
         self.info = []
+        self.lock = threading.Lock()  # Checks log from worker threads
+        self._output = threading.local()  # Per-thread buffer, flushed per check
+
+        # Shared across checks so the embedding model loads once per run
+        self._init_lock = threading.Lock()
+        self._rag_system: Optional["RAGSystem"] = None
+        self._course_count: Optional[int] = None
+
+        # Set by check_environment so later checks agree on the key's status
+        self._api_key_usable = False
+
+    def _write(self, line: str):
+        """Buffer a line of output for the current check"""
+        buffer = getattr(self._output, "buffer", None)
+        if buffer is None:
+            buffer = self._output.buffer = io.StringIO()
+        buffer.write(line + "\n")
+
+    def flush(self):
+        """Write the current check's buffered output in a single call"""
+        buffer = getattr(self._output, "buffer", None)
+        if not buffer or not buffer.tell():
+            return
+        with self.lock:
+            sys.stdout.write(buffer.getvalue())
+            sys.stdout.flush()
+        buffer.seek(0)
+        buffer.truncate()
+
+    def run_check(self, check: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Run one check and emit its output as an uninterrupted block"""
+        try:
+            return check()
+        finally:
+            self.flush()
 
     def log_issue(self, message: str):
         """Log a critical issue"""
-        self.issues.append(message)
-        print(f"❌ ISSUE: {message}")
+        with self.lock:
+            self.issues.append(message)
+        self._write(f"❌ ISSUE: {message}")
 
     def log_warning(self, message: str):
         """Log a warning"""
-        self.warnings.append(message)
-        print(f"⚠️  WARNING: {message}")
+        with self.lock:
+            self.warnings.append(message)
+        self._write(f"⚠️  WARNING: {message}")
 
     def log_info(self, message: str):
         """Log informational message"""
-        self.info.append(message)
-        print(f"ℹ️  INFO: {message}")
+        with self.lock:
+            self.info.append(message)
+        self._write(f"ℹ️  INFO: {message}")
 
     def log_success(self, message: str):
         """Log success message"""
-        print(f"✅ SUCCESS: {message}")
+        self._write(f"✅ SUCCESS: {message}")
+
+    def _get_vector_store(self) -> "VectorStore":
+        """Get the RAG system's vector store, so only one store is ever opened"""
+        return self._get_rag_system().vector_store
+
+    def _get_course_count(self) -> int:
+        """Count courses once so later checks can tell the store is empty"""
+        vector_store = self._get_vector_store()
+        with self._init_lock:
+            if self._course_count is None:
+                self._course_count = vector_store.get_course_count()
+            return self._course_count
+
+    def _get_rag_system(self) -> "RAGSystem":
+        """Create the RAG system on first use and reuse it afterwards"""
+        from rag_system import RAGSystem
+
+        with self._init_lock:
+            if self._rag_system is None:
+                self._rag_system = RAGSystem(config)
+            return self._rag_system
 
     def check_environment(self) -> Dict[str, Any]:
         """Check environment and configuration"""
-        print("\\n🔍 CHECKING ENVIRONMENT AND CONFIGURATION")
-        print("=" * 50)
+        self._write("\n🔍 CHECKING ENVIRONMENT AND CONFIGURATION")
+        self._write("=" * 50)
 
         env_status = {}
 
@@ -78,6 +142,7 @@ class SystemDiagnostics:
         else:
             self.log_success("ANTHROPIC_API_KEY is present")
             env_status["api_key"] = "present"
+        self._api_key_usable = env_status["api_key"] == "present"
 
         # Check configuration values
         config_values = {
@@ -106,24 +171,20 @@ class SystemDiagnostics:
 
     def check_vector_store(self) -> Dict[str, Any]:
         """Check vector store functionality"""
-        print("\\n🔍 CHECKING VECTOR STORE")
-        print("=" * 50)
+        self._write("\n🔍 CHECKING VECTOR STORE")
+        self._write("=" * 50)
 
         store_status = {}
 
         try:
             # Initialize vector store
-            vector_store = VectorStore(
-                chroma_path=config.CHROMA_PATH,
-                embedding_model=config.EMBEDDING_MODEL,
-                max_results=config.MAX_RESULTS,
-            )
+            vector_store = self._get_vector_store()
             self.log_success("VectorStore initialized successfully")
             store_status["initialization"] = "success"
 
             # Check collections
             try:
-                course_count = vector_store.get_course_count()
+                course_count = self._get_course_count()
                 self.log_info(f"Course count in vector store: {course_count}")
                 store_status["course_count"] = course_count
 
@@ -166,13 +227,23 @@ class SystemDiagnostics:
                 self.log_issue(f"Error during test search: {e}")
                 store_status["search_test"] = f"exception: {str(e)}"
 
-            # Check ChromaDB collections directly
+            # Check ChromaDB collections directly, reusing the catalog count
+            # from above; an empty catalog means nothing was ever loaded
+            course_count = store_status.get("course_count")
             try:
                 collections = vector_store.client.list_collections()
                 collection_info = {}
                 for collection in collections:
                     try:
-                        count = collection.count()
+                        if (
+                            collection.name == vector_store.course_catalog.name
+                            and isinstance(course_count, int)
+                        ):
+                            count = course_count
+                        elif course_count == 0:
+                            count = 0
+                        else:
+                            count = collection.count()
                         collection_info[collection.name] = count
                         self.log_info(
                             f"Collection '{collection.name}' has {count} items"
@@ -198,23 +269,27 @@ class SystemDiagnostics:
 
     def check_document_processing(self) -> Dict[str, Any]:
         """Check document processing functionality"""
-        print("\\n🔍 CHECKING DOCUMENT PROCESSING")
-        print("=" * 50)
+        self._write("\n🔍 CHECKING DOCUMENT PROCESSING")
+        self._write("=" * 50)
 
         doc_status = {}
 
         try:
             # Check docs folder
-            docs_path = "../docs"
+            docs_path = _DOCS_PATH
             if os.path.exists(docs_path):
                 self.log_success(f"Docs folder exists: {docs_path}")
 
-                # List files in docs folder
-                doc_files = [
-                    f
-                    for f in os.listdir(docs_path)
-                    if f.lower().endswith((".txt", ".pdf", ".docx"))
-                ]
+                # List files in docs folder; scandir reports the file type
+                # without a separate stat per entry
+                with os.scandir(docs_path) as entries:
+                    doc_entries = [
+                        entry
+                        for entry in entries
+                        if entry.is_file(follow_symlinks=False)
+                        and os.path.splitext(entry.name)[1].lower() in _DOC_SUFFIXES
+                    ]
+                doc_files = [entry.name for entry in doc_entries]
 
                 self.log_info(f"Found {len(doc_files)} document files")
                 doc_status["docs_folder_exists"] = True
@@ -226,10 +301,12 @@ class SystemDiagnostics:
                 # Test document processor on first file
                 if doc_files:
                     try:
+                        from document_processor import DocumentProcessor
+
                         processor = DocumentProcessor(
                             config.CHUNK_SIZE, config.CHUNK_OVERLAP
                         )
-                        first_file = os.path.join(docs_path, doc_files[0])
+                        first_file = doc_entries[0].path
 
                         self.log_info(f"Testing document processing on: {doc_files[0]}")
                         course, chunks = processor.process_course_document(first_file)
@@ -260,16 +337,16 @@ class SystemDiagnostics:
 
     def check_search_tools(self) -> Dict[str, Any]:
         """Check search tools functionality"""
-        print("\\n🔍 CHECKING SEARCH TOOLS")
-        print("=" * 50)
+        self._write("\n🔍 CHECKING SEARCH TOOLS")
+        self._write("=" * 50)
 
         tools_status = {}
 
         try:
             # Initialize components
-            vector_store = VectorStore(
-                config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
-            )
+            vector_store = self._get_vector_store()
+
+            from search_tools import CourseSearchTool, ToolManager
 
             # Test CourseSearchTool
             search_tool = CourseSearchTool(vector_store)
@@ -281,21 +358,32 @@ class SystemDiagnostics:
             tools_status["search_tool_init"] = "success"
             tools_status["tool_name"] = tool_def["name"]
 
+            # Searching an empty store can only come back empty
+            store_empty = self._get_course_count() == 0
+            if store_empty:
+                self.log_info("Skipping search execution - vector store is empty")
+
             # Test tool execution
-            try:
-                result = search_tool.execute("test query")
-                self.log_success("CourseSearchTool executed successfully")
-                self.log_info(
-                    f"Result type: {type(result)}, length: {len(str(result))}"
-                )
-                tools_status["tool_execution"] = "success"
-                tools_status["result_sample"] = (
-                    str(result)[:100] + "..." if len(str(result)) > 100 else str(result)
-                )
+            if store_empty:
+                tools_status["tool_execution"] = "skipped_empty_store"
+            else:
+                try:
+                    result = search_tool.execute("test query")
+                    result_text = str(result)
+                    self.log_success("CourseSearchTool executed successfully")
+                    self.log_info(
+                        f"Result type: {type(result)}, length: {len(result_text)}"
+                    )
+                    tools_status["tool_execution"] = "success"
+                    tools_status["result_sample"] = (
+                        result_text[:100] + "..."
+                        if len(result_text) > 100
+                        else result_text
+                    )
 
-            except Exception as e:
-                self.log_issue(f"Error executing search tool: {e}")
-                tools_status["tool_execution"] = f"error: {str(e)}"
+                except Exception as e:
+                    self.log_issue(f"Error executing search tool: {e}")
+                    tools_status["tool_execution"] = f"error: {str(e)}"
 
             # Test ToolManager
             try:
@@ -310,16 +398,19 @@ class SystemDiagnostics:
                 tools_status["registered_tools"] = len(definitions)
 
                 # Test tool execution through manager
-                try:
-                    manager_result = tool_manager.execute_tool(
-                        "search_course_content", query="test"
-                    )
-                    self.log_success("Tool execution through manager successful")
-                    tools_status["manager_execution"] = "success"
+                if store_empty:
+                    tools_status["manager_execution"] = "skipped_empty_store"
+                else:
+                    try:
+                        manager_result = tool_manager.execute_tool(
+                            "search_course_content", query="test"
+                        )
+                        self.log_success("Tool execution through manager successful")
+                        tools_status["manager_execution"] = "success"
 
-                except Exception as e:
-                    self.log_issue(f"Error executing tool through manager: {e}")
-                    tools_status["manager_execution"] = f"error: {str(e)}"
+                    except Exception as e:
+                        self.log_issue(f"Error executing tool through manager: {e}")
+                        tools_status["manager_execution"] = f"error: {str(e)}"
 
             except Exception as e:
                 self.log_issue(f"Error with ToolManager: {e}")
@@ -333,12 +424,14 @@ class SystemDiagnostics:
 
     def check_ai_generator(self) -> Dict[str, Any]:
         """Check AI generator functionality"""
-        print("\\n🔍 CHECKING AI GENERATOR")
-        print("=" * 50)
+        self._write("\n🔍 CHECKING AI GENERATOR")
+        self._write("=" * 50)
 
         ai_status = {}
 
         try:
+            from ai_generator import AIGenerator
+
             # Initialize AI generator
             ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
             self.log_success("AIGenerator initialized successfully")
@@ -371,14 +464,14 @@ class SystemDiagnostics:
 
     def check_full_system_integration(self) -> Dict[str, Any]:
         """Test full system integration"""
-        print("\\n🔍 CHECKING FULL SYSTEM INTEGRATION")
-        print("=" * 50)
+        self._write("\n🔍 CHECKING FULL SYSTEM INTEGRATION")
+        self._write("=" * 50)
 
         integration_status = {}
 
         try:
             # Initialize RAG system
-            rag_system = RAGSystem(config)
+            rag_system = self._get_rag_system()
             self.log_success("RAGSystem initialized successfully")
             integration_status["rag_init"] = "success"
 
@@ -416,19 +509,19 @@ class SystemDiagnostics:
 
     def run_sample_query_test(self) -> Dict[str, Any]:
         """Attempt to run a sample query (if API key available)"""
-        print("\\n🔍 RUNNING SAMPLE QUERY TEST")
-        print("=" * 50)
+        self._write("\n🔍 RUNNING SAMPLE QUERY TEST")
+        self._write("=" * 50)
 
         query_status = {}
 
         # Only run if API key is present and valid-looking
-        if not config.ANTHROPIC_API_KEY or len(config.ANTHROPIC_API_KEY) < 20:
+        if not self._api_key_usable:
             self.log_warning("Skipping query test - API key not available or invalid")
             query_status["skipped"] = "no_api_key"
             return query_status
 
         try:
-            rag_system = RAGSystem(config)
+            rag_system = self._get_rag_system()
 
             # Try a simple query
             test_query = "What courses are available?"
@@ -436,16 +529,17 @@ class SystemDiagnostics:
 
             try:
                 response, sources = rag_system.query(test_query)
+                preview = response[:200]
 
                 self.log_success("Query executed successfully")
                 self.log_info(f"Response length: {len(response)}")
                 self.log_info(f"Number of sources: {len(sources)}")
-                self.log_info(f"Response preview: {response[:200]}...")
+                self.log_info(f"Response preview: {preview}...")
 
                 query_status["success"] = True
                 query_status["response_length"] = len(response)
                 query_status["sources_count"] = len(sources)
-                query_status["response_preview"] = response[:200]
+                query_status["response_preview"] = preview
 
             except Exception as e:
                 self.log_issue(f"Query failed: {e}")
@@ -462,34 +556,34 @@ class SystemDiagnostics:
 
     def generate_report(self, all_status: Dict[str, Any]) -> str:
         """Generate comprehensive diagnostic report"""
-        report = []
-        report.append("\\n" + "=" * 60)
+        report: List[str] = []
+        report.append("\n" + "=" * 60)
         report.append("RAG SYSTEM DIAGNOSTIC REPORT")
         report.append("=" * 60)
 
         # Summary
-        report.append("\\n📊 SUMMARY")
+        report.append("\n📊 SUMMARY")
         report.append("-" * 20)
         report.append(f"Issues found: {len(self.issues)}")
         report.append(f"Warnings: {len(self.warnings)}")
         report.append(f"Info messages: {len(self.info)}")
 
         if self.issues:
-            report.append("\\n❌ CRITICAL ISSUES:")
+            report.append("\n❌ CRITICAL ISSUES:")
             for issue in self.issues:
                 report.append(f"  • {issue}")
 
         if self.warnings:
-            report.append("\\n⚠️  WARNINGS:")
+            report.append("\n⚠️  WARNINGS:")
             for warning in self.warnings:
                 report.append(f"  • {warning}")
 
         # Detailed status
-        report.append("\\n📋 DETAILED STATUS")
+        report.append("\n📋 DETAILED STATUS")
         report.append("-" * 20)
 
         for component, status in all_status.items():
-            report.append(f"\\n{component.upper().replace('_', ' ')}:")
+            report.append(f"\n{component.upper().replace('_', ' ')}:")
             if isinstance(status, dict):
                 for key, value in status.items():
                     report.append(f"  {key}: {value}")
@@ -497,7 +591,7 @@ class SystemDiagnostics:
                 report.append(f"  {status}")
 
         # Recommendations
-        report.append("\\n💡 RECOMMENDATIONS")
+        report.append("\n💡 RECOMMENDATIONS")
         report.append("-" * 20)
 
         if not config.ANTHROPIC_API_KEY:
@@ -516,9 +610,9 @@ class SystemDiagnostics:
                 "• Address all critical issues before expecting queries to work"
             )
 
-        report.append("\\n" + "=" * 60)
+        report.append("\n" + "=" * 60)
 
-        return "\\n".join(report)
+        return "\n".join(report)
 
 
 def main():
@@ -529,14 +623,25 @@ def main():
     diagnostics = SystemDiagnostics()
     all_status = {}
 
-    # Run all diagnostic checks
-    all_status["environment"] = diagnostics.check_environment()
-    all_status["vector_store"] = diagnostics.check_vector_store()
-    all_status["document_processing"] = diagnostics.check_document_processing()
-    all_status["search_tools"] = diagnostics.check_search_tools()
-    all_status["ai_generator"] = diagnostics.check_ai_generator()
-    all_status["system_integration"] = diagnostics.check_full_system_integration()
-    all_status["query_test"] = diagnostics.run_sample_query_test()
+    # Environment runs first so its findings lead the log
+    all_status["environment"] = diagnostics.run_check(diagnostics.check_environment)
+
+    # The remaining checks are independent and I/O-bound, so overlap them
+    checks = {
+        "vector_store": diagnostics.check_vector_store,
+        "document_processing": diagnostics.check_document_processing,
+        "search_tools": diagnostics.check_search_tools,
+        "ai_generator": diagnostics.check_ai_generator,
+        "system_integration": diagnostics.check_full_system_integration,
+        "query_test": diagnostics.run_sample_query_test,
+    }
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        futures = {
+            name: executor.submit(diagnostics.run_check, check)
+            for name, check in checks.items()
+        }
+        for name, future in futures.items():
+            all_status[name] = future.result()
 
     # Generate and display report
     report = diagnostics.generate_report(all_status)
@@ -545,11 +650,11 @@ def main():
     # Save report to file
     report_path = "diagnostic_report.txt"
     try:
-        with open(report_path, "w") as f:
+        with open(report_path, "w", buffering=1 << 16) as f:
             f.write(report)
-        print(f"\\n📄 Report saved to: {report_path}")
+        print(f"\n📄 Report saved to: {report_path}")
     except Exception as e:
-        print(f"\\n❌ Error saving report: {e}")
+        print(f"\n❌ Error saving report: {e}")
 
     # Return status for programmatic use
     return {
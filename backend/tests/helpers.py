@@ -0,0 +1,23 @@
+"""Shared test doubles; fixtures stay in conftest.py"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+
+@dataclass(slots=True, frozen=True)
+class MockContent:
+    """Mock content block for Anthropic responses"""
+
+    type: str
+    text: str = None
+    id: str = None
+    name: str = None
+    input: Dict[str, Any] = None
+
+
+@dataclass(slots=True, frozen=True)
+class MockResponse:
+    """Mock Anthropic API response"""
+
+    content: List[MockContent]
+    stop_reason: str = "end_turn"
@@ -1,682 +1,758 @@
 import os
 import sys
+import threading
 from dataclasses import dataclass
-from typing import Any, Dict, List
-from unittest.mock import MagicMock, Mock, patch
+from typing import Any, Dict, List, Optional, Tuple
+from unittest.mock import MagicMock, Mock, call, patch
 
+import anthropic
+import httpx
 import pytest
 
 # Add backend to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ai_generator import AIGenerator
-from search_tools import CourseSearchTool, ToolManager
+from search_tools import (
+    CourseOutlineTool,
+    CourseSearchTool,
+    ToolManager,
+    TransientToolError,
+)
+from tests.helpers import MockContent, MockResponse
+from vector_store import SearchResults
 
 
-@dataclass
-class MockContent:
-    """Mock content block for Anthropic responses"""
+@dataclass(slots=True, frozen=True)
+class MockStreamEvent:
+    """Mock event yielded by an Anthropic message stream"""
 
     type: str
     text: str = None
-    id: str = None
-    name: str = None
-    input: Dict[str, Any] = None
+    content_block: MockContent = None
 
 
-@dataclass
-class MockResponse:
-    """Mock Anthropic API response"""
+def make_text_response(text: str) -> MockResponse:
+    """Build a final response holding a single text block"""
+    return MockResponse([MockContent(type="text", text=text)], "end_turn")
 
-    content: List[MockContent]
-    stop_reason: str
 
+def make_tool_response(
+    tool_id: str, name: str, tool_input: Dict[str, Any]
+) -> MockResponse:
+    """Build a response requesting a single tool call"""
+    return MockResponse(
+        [MockContent(type="tool_use", id=tool_id, name=name, input=tool_input)],
+        "tool_use",
+    )
 
-class TestAIGenerator:
-    """Test suite for AIGenerator functionality"""
 
-    @pytest.fixture
-    def api_key(self):
-        """Mock API key for testing"""
-        return "test_api_key"
+def respond_with(*responses):
+    """Return a side_effect callable handing out responses in order"""
+    remaining = iter(responses)
+    return lambda *args, **kwargs: next(remaining)
 
-    @pytest.fixture
-    def model(self):
-        """Model name for testing"""
-        return "claude-3-sonnet-20240229"
 
-    @pytest.fixture
-    def ai_generator(self, api_key, model):
-        """Create AIGenerator instance for testing"""
-        return AIGenerator(api_key, model)
+def make_client(*, side_effect=None, return_value=None) -> Mock:
+    """Build a mock Anthropic client whose messages.create is preconfigured"""
+    client = Mock()
+    if side_effect is not None:
+        client.messages.create.side_effect = side_effect
+    else:
+        client.messages.create.return_value = return_value
+    return client
 
-    @pytest.fixture
-    def mock_tool_manager(self):
-        """Create mock tool manager"""
-        manager = Mock(spec=ToolManager)
-        manager.get_tool_definitions.return_value = [
-            {
-                "name": "search_course_content",
-                "description": "Search course content",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string"},
-                        "course_name": {"type": "string"},
-                    },
-                    "required": ["query"],
-                },
-            }
-        ]
-        return manager
 
-    def test_initialization(self, ai_generator, api_key, model):
-        """Test AIGenerator initialization"""
-        print("\\n=== Testing AIGenerator Initialization ===")
-        try:
-            assert ai_generator.model == model
-            assert ai_generator.base_params["model"] == model
-            assert ai_generator.base_params["temperature"] == 0
-            assert ai_generator.base_params["max_tokens"] == 800
-            print("✅ AIGenerator initialization successful")
-
-        except Exception as e:
-            print(f"❌ AIGenerator initialization failed: {e}")
-            raise
-
-    def test_system_prompt(self, ai_generator):
-        """Test system prompt content and structure"""
-        print("\\n=== Testing System Prompt ===")
-        try:
-            assert hasattr(ai_generator, "SYSTEM_PROMPT")
-            prompt = ai_generator.SYSTEM_PROMPT
-
-            # Check for key elements in system prompt
-            assert "course materials" in prompt.lower()
-            assert "search tool" in prompt.lower() or "content search" in prompt.lower()
-            assert "educational" in prompt.lower()
-            print("✅ System prompt structure validated")
-
-        except Exception as e:
-            print(f"❌ System prompt test failed: {e}")
-            raise
-
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_without_tools(self, mock_anthropic, ai_generator):
-        """Test generating response without tool usage"""
-        print("\\n=== Testing Response Generation Without Tools ===")
-        try:
-            # Setup mock client
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-
-            # Setup mock response
-            mock_response = MockResponse(
-                content=[MockContent(type="text", text="This is a direct response.")],
-                stop_reason="end_turn",
-            )
-            mock_client.messages.create.return_value = mock_response
+class MockStream:
+    """Mock Anthropic message stream context manager"""
 
-            # Replace client in ai_generator
-            ai_generator.client = mock_client
+    __slots__ = ("events", "final_message")
 
-            # Generate response
-            result = ai_generator.generate_response("What is machine learning?")
+    def __init__(self, events: List[MockStreamEvent], final_message: MockResponse):
+        self.events = events
+        self.final_message = final_message
 
-            # Verify API call
-            mock_client.messages.create.assert_called_once()
-            call_args = mock_client.messages.create.call_args[1]
+    def __enter__(self):
+        return self
 
-            assert call_args["model"] == ai_generator.model
-            assert call_args["temperature"] == 0
-            assert call_args["max_tokens"] == 800
-            assert len(call_args["messages"]) == 1
-            assert call_args["messages"][0]["role"] == "user"
-            assert call_args["messages"][0]["content"] == "What is machine learning?"
+    def __exit__(self, *exc_info):
+        return False
 
-            # Verify response
-            assert result == "This is a direct response."
-            print("✅ Response generation without tools successful")
+    def __iter__(self):
+        return iter(self.events)
 
-        except Exception as e:
-            print(f"❌ Response generation without tools failed: {e}")
-            raise
+    def get_final_message(self) -> MockResponse:
+        return self.final_message
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_with_conversation_history(
-        self, mock_anthropic, ai_generator
-    ):
-        """Test generating response with conversation history"""
-        print("\\n=== Testing Response with Conversation History ===")
-        try:
-            # Setup mock client
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            mock_response = MockResponse(
-                content=[MockContent(type="text", text="Response with history.")],
-                stop_reason="end_turn",
-            )
-            mock_client.messages.create.return_value = mock_response
 
-            # Generate response with history
-            history = "User: Previous question\\nAssistant: Previous answer"
-            result = ai_generator.generate_response(
-                "Follow up question", conversation_history=history
-            )
+# Shared by every mock tool manager; tests must not mutate it
+TOOL_DEFINITIONS = [
+    {
+        "name": "search_course_content",
+        "description": "Search course content",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string"},
+                "course_name": {"type": "string"},
+            },
+            "required": ["query"],
+        },
+    }
+]
 
-            # Verify system prompt includes history
-            call_args = mock_client.messages.create.call_args[1]
-            system_content = call_args["system"]
-            assert "Previous conversation:" in system_content
-            assert history in system_content
 
-            print("✅ Response with conversation history successful")
+class StubToolManager:
+    """Tool manager double exposing only what AIGenerator calls"""
 
-        except Exception as e:
-            print(f"❌ Response with conversation history failed: {e}")
-            raise
+    def __init__(self):
+        self.get_tool_definitions = Mock(return_value=TOOL_DEFINITIONS)
+        self.execute_tool = Mock()
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_with_tools_no_use(
-        self, mock_anthropic, ai_generator, mock_tool_manager
-    ):
-        """Test generating response with tools available but not used"""
-        print("\\n=== Testing Response with Tools Available (Not Used) ===")
-        try:
-            # Setup mock client
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            mock_response = MockResponse(
-                content=[MockContent(type="text", text="Direct answer without tools.")],
-                stop_reason="end_turn",
-            )
-            mock_client.messages.create.return_value = mock_response
 
-            # Generate response with tools
-            tools = mock_tool_manager.get_tool_definitions()
-            result = ai_generator.generate_response(
-                "What is 2 + 2?", tools=tools, tool_manager=mock_tool_manager
-            )
+class StubVectorStore:
+    """Vector store double exposing only the methods the search tools call"""
 
-            # Verify tools were passed to API
-            call_args = mock_client.messages.create.call_args[1]
-            assert "tools" in call_args
-            assert call_args["tool_choice"] == {"type": "auto"}
-            assert len(call_args["tools"]) == 1
+    def __init__(self):
+        self.search = Mock()
+        self.prefetch_course_links = Mock()
+        self.get_lesson_link = Mock()
+        self._resolve_course_name = Mock()
 
-            # Verify response
-            assert result == "Direct answer without tools."
-            print("✅ Response with tools available (not used) successful")
+    def reset_mock(self, **kwargs):
+        """Reset every stubbed method, forwarding Mock.reset_mock options"""
+        for method in vars(self).values():
+            method.reset_mock(**kwargs)
 
-        except Exception as e:
-            print(f"❌ Response with tools available failed: {e}")
-            raise
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_with_single_tool_use(
-        self, mock_anthropic, ai_generator, mock_tool_manager
-    ):
-        """Test generating response with single tool usage (backward compatibility)"""
-        print("\\n=== Testing Response with Single Tool Usage ===")
-        try:
-            # Setup mock client
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            # First response: tool use
-            tool_use_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_123",
-                        name="search_course_content",
-                        input={"query": "machine learning", "course_name": "AI Course"},
-                    )
-                ],
-                stop_reason="tool_use",
-            )
+@dataclass(frozen=True)
+class SingleTurnCase:
+    """A query Claude answers directly, with the inputs that shape the call"""
 
-            # Final response after tool execution
-            final_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="text",
-                        text="Based on the search results, here's what I found...",
-                    )
-                ],
-                stop_reason="end_turn",
-            )
+    query: str
+    history: Optional[str] = None
+    with_tools: bool = False
+    max_rounds: int = 2
 
-            # Setup mock client to return both responses
-            mock_client.messages.create.side_effect = [
-                tool_use_response,
-                final_response,
-            ]
 
-            # Setup tool manager to return mock result
-            mock_tool_manager.execute_tool.return_value = (
-                "Search results: Machine learning is..."
-            )
+SINGLE_TURN_CASES = {
+    "no_tools": SingleTurnCase("What is machine learning?"),
+    "history": SingleTurnCase(
+        "Follow up question",
+        history="User: Previous question\nAssistant: Previous answer",
+    ),
+    "tools_not_used": SingleTurnCase("What is 2 + 2?", with_tools=True),
+    "early_termination": SingleTurnCase("What is 2+2?", with_tools=True, max_rounds=2),
+}
 
-            # Generate response with tool usage
-            tools = mock_tool_manager.get_tool_definitions()
-            result = ai_generator.generate_response(
-                "Tell me about machine learning in AI Course",
-                tools=tools,
-                tool_manager=mock_tool_manager,
-            )
 
-            # Verify tool was executed
-            mock_tool_manager.execute_tool.assert_called_once_with(
-                "search_course_content",
-                query="machine learning",
-                course_name="AI Course",
-            )
+@dataclass(frozen=True)
+class ToolRoundsCase:
+    """Tool calls Claude makes one round at a time before its final answer"""
 
-            # Verify two API calls were made
-            assert mock_client.messages.create.call_count == 2
+    tool_calls: Tuple[Tuple[str, str, Dict[str, Any]], ...]
+    tool_results: Tuple[str, ...]
+    max_rounds: int
+    final_text: str
 
-            # Check second API call structure
-            second_call_args = mock_client.messages.create.call_args_list[1][1]
-            messages = second_call_args["messages"]
 
-            # Should have original user message + assistant tool use + user tool result
-            assert len(messages) == 3
-            assert messages[0]["role"] == "user"  # Original query
-            assert messages[1]["role"] == "assistant"  # Tool use
-            assert messages[2]["role"] == "user"  # Tool result
+TOOL_ROUNDS_CASES = {
+    # A second tool call after seeing the first tool's results
+    "sequential_tools": ToolRoundsCase(
+        tool_calls=(
+            ("tool_1", "get_course_outline", {"course_name": "MCP Course"}),
+            (
+                "tool_2",
+                "search_course_content",
+                {"query": "lesson 3 content", "course_name": "MCP Course"},
+            ),
+        ),
+        tool_results=(
+            "Course outline: Lesson 1, Lesson 2, Lesson 3...",
+            "Lesson 3 detailed content...",
+        ),
+        max_rounds=3,
+        final_text="Here's the comprehensive information about lesson 3...",
+    ),
+    # Claude would keep calling tools; the round limit forces an answer
+    "max_rounds_reached": ToolRoundsCase(
+        tool_calls=(("tool_x", "search_course_content", {"query": "test"}),),
+        tool_results=("Tool result",),
+        max_rounds=2,
+        final_text="Final answer after max rounds",
+    ),
+}
+
+
+@pytest.fixture(autouse=True)
+def mock_client(monkeypatch):
+    """Make every Anthropic client built during a test the same mock"""
+    client = Mock()
+    monkeypatch.setattr("ai_generator.anthropic.Anthropic", lambda *a, **k: client)
+    return client
 
-            # Verify final result
-            assert result == "Based on the search results, here's what I found..."
-            print("✅ Response with single tool usage successful")
 
-        except Exception as e:
-            print(f"❌ Response with single tool usage failed: {e}")
-            raise
+class TestAIGenerator:
+    """Test suite for AIGenerator functionality"""
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_tool_execution_handling(
-        self, mock_anthropic, ai_generator, mock_tool_manager
-    ):
-        """Test detailed tool execution handling"""
-        print("\\n=== Testing Tool Execution Handling ===")
-        try:
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            # Create tool use response with multiple tools
-            tool_use_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_1",
-                        name="search_course_content",
-                        input={"query": "introduction"},
-                    ),
-                    MockContent(type="text", text="I'm searching for information..."),
-                ],
-                stop_reason="tool_use",
-            )
+    @pytest.fixture(scope="module")
+    def api_key(self):
+        """Mock API key for testing"""
+        return "test_api_key"
 
-            final_response = MockResponse(
-                content=[MockContent(type="text", text="Here are the results...")],
-                stop_reason="end_turn",
-            )
+    @pytest.fixture(scope="module")
+    def model(self):
+        """Model name for testing"""
+        return "claude-3-sonnet-20240229"
 
-            mock_client.messages.create.side_effect = [
-                tool_use_response,
-                final_response,
-            ]
-            mock_tool_manager.execute_tool.return_value = "Tool execution result"
-
-            # Test _handle_tool_execution directly
-            base_params = {
-                "messages": [{"role": "user", "content": "test query"}],
-                "system": "test system prompt",
-            }
+    @pytest.fixture(scope="module")
+    def ai_generator(self, api_key, model):
+        """Create one AIGenerator shared by the module's tests"""
+        return AIGenerator(api_key, model)
 
-            result = ai_generator._handle_tool_execution(
-                tool_use_response, base_params, mock_tool_manager
-            )
+    @pytest.fixture(autouse=True)
+    def restore_ai_generator(self, ai_generator):
+        """Undo per-test client swaps on the shared generator"""
+        saved = (ai_generator.client, ai_generator.base_params)
+        yield
+        ai_generator.client, ai_generator.base_params = saved
 
-            # Verify tool execution
-            mock_tool_manager.execute_tool.assert_called_once_with(
-                "search_course_content", query="introduction"
-            )
+    @pytest.fixture
+    def mock_tool_manager(self):
+        """Create mock tool manager"""
+        return StubToolManager()
 
-            # Verify final API call structure
-            final_call_args = mock_client.messages.create.call_args[1]
-            messages = final_call_args["messages"]
+    @pytest.fixture
+    def tools(self, mock_tool_manager):
+        """Tool definitions advertised by the mock tool manager"""
+        return mock_tool_manager.get_tool_definitions.return_value
 
-            assert len(messages) == 3
-            # Check tool result message structure
-            tool_result_msg = messages[2]
-            assert tool_result_msg["role"] == "user"
-            assert isinstance(tool_result_msg["content"], list)
-            assert tool_result_msg["content"][0]["type"] == "tool_result"
-            assert tool_result_msg["content"][0]["tool_use_id"] == "tool_1"
-            assert tool_result_msg["content"][0]["content"] == "Tool execution result"
+    def test_initialization(self, ai_generator, api_key, model):
+        """Test AIGenerator initialization"""
+        assert ai_generator.model == model
+        assert ai_generator.base_params["model"] == model
+        assert ai_generator.base_params["temperature"] == 0
+        assert ai_generator.base_params["max_tokens"] == 800
 
-            print("✅ Tool execution handling successful")
+    def test_shared_http_client(self, ai_generator, model, monkeypatch):
+        """Test generators reuse one pooled HTTP client"""
+        monkeypatch.undo()  # Build a real client rather than the mock
+        other_generator = AIGenerator("other_api_key", model)
+        assert ai_generator.client._client is other_generator.client._client
 
-        except Exception as e:
-            print(f"❌ Tool execution handling failed: {e}")
-            raise
+    def test_system_prompt_block_reused(self, ai_generator):
+        """Test the static system block is built once and shared across calls"""
+        first = ai_generator._build_system_blocks()
+        second = ai_generator._build_system_blocks("User: hi\nAssistant: hello")
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_api_error_handling(self, mock_anthropic, ai_generator):
-        """Test API error handling"""
-        print("\\n=== Testing API Error Handling ===")
-        try:
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            # Simulate API error
-            mock_client.messages.create.side_effect = Exception(
-                "API Error: Rate limit exceeded"
-            )
+        assert first[0] is ai_generator.system_prompt_block
+        assert second[0] is ai_generator.system_prompt_block
 
-            # This should raise the exception
-            with pytest.raises(Exception) as exc_info:
-                ai_generator.generate_response("test query")
-
-            assert "API Error" in str(exc_info.value)
-            print("✅ API error handling successful")
-
-        except Exception as e:
-            print(f"❌ API error handling test failed: {e}")
-            raise
-
-    def test_parameter_validation(self, ai_generator, mock_tool_manager):
-        """Test parameter validation and edge cases"""
-        print("\\n=== Testing Parameter Validation ===")
-        try:
-            # Test empty query
-            with patch.object(ai_generator.client, "messages") as mock_messages:
-                mock_response = MockResponse(
-                    content=[MockContent(type="text", text="Empty query response")],
-                    stop_reason="end_turn",
-                )
-                mock_messages.create.return_value = mock_response
-
-                result = ai_generator.generate_response("")
-                assert isinstance(result, str)
-                print("✅ Empty query handling successful")
-
-            # Test None parameters
-            with patch.object(ai_generator.client, "messages") as mock_messages:
-                mock_response = MockResponse(
-                    content=[MockContent(type="text", text="None params response")],
-                    stop_reason="end_turn",
-                )
-                mock_messages.create.return_value = mock_response
-
-                result = ai_generator.generate_response("query", None, None, None)
-                assert isinstance(result, str)
-                print("✅ None parameters handling successful")
-
-        except Exception as e:
-            print(f"❌ Parameter validation test failed: {e}")
-            raise
-
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_sequential_tool_calls(
-        self, mock_anthropic, ai_generator, mock_tool_manager
+    def test_system_prompt(self, ai_generator):
+        """Test system prompt content and structure"""
+        assert hasattr(ai_generator, "SYSTEM_PROMPT")
+        prompt = ai_generator.SYSTEM_PROMPT.lower()
+
+        # Check for key elements in system prompt
+        assert all(keyword in prompt for keyword in ("course materials", "educational"))
+        assert "search tool" in prompt or "content search" in prompt
+
+    @pytest.mark.parametrize(
+        "case", SINGLE_TURN_CASES.values(), ids=SINGLE_TURN_CASES.keys()
+    )
+    def test_single_turn_response(
+        self, case, mock_client, ai_generator, mock_tool_manager, tools
     ):
-        """Test sequential tool calling with 2 rounds"""
-        print("\\n=== Testing Sequential Tool Calls ===")
-        try:
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            # Round 1: First tool call
-            first_tool_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_1",
-                        name="get_course_outline",
-                        input={"course_name": "MCP Course"},
-                    )
-                ],
-                stop_reason="tool_use",
-            )
+        """Test responses Claude answers directly in one API call"""
+        ai_generator.client = mock_client
+        mock_client.messages.create.return_value = make_text_response("Direct answer")
+
+        tool_kwargs = {}
+        if case.with_tools:
+            tool_kwargs = {
+                "tools": tools,
+                "tool_manager": mock_tool_manager,
+            }
 
-            # Round 2: Second tool call after seeing first results
-            second_tool_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_2",
-                        name="search_course_content",
-                        input={
-                            "query": "lesson 3 content",
-                            "course_name": "MCP Course",
-                        },
-                    )
-                ],
-                stop_reason="tool_use",
-            )
+        result = ai_generator.generate_response(
+            case.query,
+            conversation_history=case.history,
+            max_rounds=case.max_rounds,
+            **tool_kwargs,
+        )
+
+        assert result == "Direct answer"
+        mock_client.messages.create.assert_called_once()
+        mock_tool_manager.execute_tool.assert_not_called()
+
+        call_args = mock_client.messages.create.call_args[1]
+        assert call_args["model"] == ai_generator.model
+        assert call_args["temperature"] == 0
+        assert call_args["max_tokens"] == 800
+        assert call_args["messages"] == [{"role": "user", "content": case.query}]
+
+        # History follows the static system prompt as its own block
+        system_blocks = call_args["system"]
+        assert system_blocks[0]["text"] == ai_generator.SYSTEM_PROMPT
+        if case.history:
+            assert len(system_blocks) == 2
+            assert "Previous conversation:" in system_blocks[1]["text"]
+            assert case.history in system_blocks[1]["text"]
+        else:
+            assert len(system_blocks) == 1
+
+        if case.with_tools:
+            assert call_args["tool_choice"] == {"type": "auto"}
+            assert len(call_args["tools"]) == 1
+        else:
+            assert "tools" not in call_args
 
-            # Final response after all tool calls
-            final_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="text",
-                        text="Here's the comprehensive information about lesson 3...",
-                    )
-                ],
-                stop_reason="end_turn",
-            )
+    def test_prompt_caching_breakpoints(
+        self, mock_client, ai_generator, mock_tool_manager, tools
+    ):
+        """Test cache_control on system prompt and latest tool results"""
+        ai_generator.client = mock_client
+
+        tool_use_response = make_tool_response(
+            "tool_1", "search_course_content", {"query": "caching"}
+        )
+        final_response = make_text_response("Cached answer")
+        mock_client.messages.create.side_effect = respond_with(
+            tool_use_response, final_response
+        )
+        mock_tool_manager.execute_tool.return_value = "Tool result"
+
+        ai_generator.generate_response(
+            "Explain caching",
+            tools=tools,
+            tool_manager=mock_tool_manager,
+        )
+
+        first_call = mock_client.messages.create.call_args_list[0][1]
+        assert first_call["system"][0]["cache_control"] == {
+            "type": "ephemeral",
+            "ttl": "5m",
+        }
+
+        # Second round caches the first round's tool results
+        second_call = mock_client.messages.create.call_args_list[1][1]
+        tool_results = second_call["messages"][-1]["content"]
+        assert tool_results[-1]["cache_control"] == ai_generator.cache_control
 
-            mock_client.messages.create.side_effect = [
-                first_tool_response,
-                second_tool_response,
-                final_response,
-            ]
-
-            # Setup tool manager responses
-            mock_tool_manager.execute_tool.side_effect = [
-                "Course outline: Lesson 1, Lesson 2, Lesson 3...",
-                "Lesson 3 detailed content...",
-            ]
-
-            # Execute sequential tool calling
-            tools = mock_tool_manager.get_tool_definitions()
-            result = ai_generator.generate_response(
-                "Tell me about lesson 3 in MCP Course with detailed content",
-                tools=tools,
-                tool_manager=mock_tool_manager,
-                max_rounds=2,
+    def test_generate_response_with_single_tool_use(
+        self, mock_client, ai_generator, mock_tool_manager, tools
+    ):
+        """Test generating response with single tool usage (backward compatibility)"""
+        # Setup mock client
+        ai_generator.client = mock_client
+
+        # First response: tool use
+        tool_use_response = make_tool_response(
+            "tool_123",
+            "search_course_content",
+            {"query": "machine learning", "course_name": "AI Course"},
+        )
+
+        # Final response after tool execution
+        final_response = make_text_response(
+            "Based on the search results, here's what I found..."
+        )
+
+        # Setup mock client to return both responses
+        mock_client.messages.create.side_effect = respond_with(
+            tool_use_response, final_response
+        )
+
+        # Setup tool manager to return mock result
+        mock_tool_manager.execute_tool.return_value = (
+            "Search results: Machine learning is..."
+        )
+
+        # Generate response with tool usage
+        result = ai_generator.generate_response(
+            "Tell me about machine learning in AI Course",
+            tools=tools,
+            tool_manager=mock_tool_manager,
+        )
+
+        # Verify tool was executed
+        assert mock_tool_manager.execute_tool.call_args_list == [
+            call(
+                "search_course_content",
+                query="machine learning",
+                course_name="AI Course",
             )
+        ]
 
-            # Verify both tools were executed
-            assert mock_tool_manager.execute_tool.call_count == 2
+        # Verify two API calls were made
+        assert mock_client.messages.create.call_count == 2
 
-            # Check first tool call
-            first_call = mock_tool_manager.execute_tool.call_args_list[0]
-            assert first_call[0][0] == "get_course_outline"
-            assert first_call[1]["course_name"] == "MCP Course"
+        # Check second API call structure
+        second_call_args = mock_client.messages.create.call_args_list[1][1]
+        messages = second_call_args["messages"]
 
-            # Check second tool call
-            second_call = mock_tool_manager.execute_tool.call_args_list[1]
-            assert second_call[0][0] == "search_course_content"
+        # Should have original user message + assistant tool use + user tool result
+        assert len(messages) == 3
+        assert messages[0]["role"] == "user"  # Original query
+        assert messages[1]["role"] == "assistant"  # Tool use
+        assert messages[2]["role"] == "user"  # Tool result
 
-            # Verify 3 API calls were made (2 tool rounds + 1 final synthesis)
-            assert mock_client.messages.create.call_count == 3
+        # Assistant tool use is stored as plain dicts, not SDK objects
+        assert messages[1]["content"] == [
+            {
+                "type": "tool_use",
+                "id": "tool_123",
+                "name": "search_course_content",
+                "input": {"query": "machine learning", "course_name": "AI Course"},
+            }
+        ]
 
-            # Verify final result
-            assert result == "Here's the comprehensive information about lesson 3..."
-            print("✅ Sequential tool calls successful")
+        # Verify final result
+        assert result == "Based on the search results, here's what I found..."
+
+    def test_parallel_tool_execution(self, ai_generator, mock_tool_manager):
+        """Test tool calls in one round run concurrently and keep their order"""
+        tool_use_response = MockResponse(
+            content=[
+                MockContent(
+                    type="tool_use",
+                    id="tool_search",
+                    name="search_course_content",
+                    input={"query": "agents"},
+                ),
+                MockContent(
+                    type="tool_use",
+                    id="tool_outline",
+                    name="get_course_outline",
+                    input={"course_name": "MCP"},
+                ),
+            ],
+            stop_reason="tool_use",
+        )
 
-        except Exception as e:
-            print(f"❌ Sequential tool calls failed: {e}")
-            raise
+        # Both calls must be in flight at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=2)
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_max_rounds_enforcement(
-        self, mock_anthropic, ai_generator, mock_tool_manager
-    ):
-        """Test that system respects max_rounds limit"""
-        print("\\n=== Testing Max Rounds Enforcement ===")
-        try:
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            # Always return tool use responses (would go infinite without max_rounds)
-            tool_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_x",
-                        name="search_course_content",
-                        input={"query": "test"},
-                    )
-                ],
-                stop_reason="tool_use",
-            )
+        def execute_tool(name, **kwargs):
+            barrier.wait()
+            return f"{name} result"
 
-            final_response = MockResponse(
-                content=[
-                    MockContent(type="text", text="Final answer after max rounds")
-                ],
-                stop_reason="end_turn",
-            )
+        mock_tool_manager.execute_tool.side_effect = execute_tool
 
-            # Return tool responses for first 2 calls, then final response
-            mock_client.messages.create.side_effect = [
-                tool_response,
-                tool_response,
-                final_response,
-            ]
-            mock_tool_manager.execute_tool.return_value = "Tool result"
-
-            # Test with max_rounds=2
-            tools = mock_tool_manager.get_tool_definitions()
-            result = ai_generator.generate_response(
-                "Test max rounds",
-                tools=tools,
-                tool_manager=mock_tool_manager,
-                max_rounds=2,
-            )
+        tool_results = ai_generator._execute_tools_for_round(
+            tool_use_response, mock_tool_manager
+        )
 
-            # Should have made exactly 3 API calls (2 rounds + 1 final)
-            assert mock_client.messages.create.call_count == 3
-            assert mock_tool_manager.execute_tool.call_count == 2
-            assert result == "Final answer after max rounds"
-            print("✅ Max rounds enforcement successful")
+        assert [r["tool_use_id"] for r in tool_results] == [
+            "tool_search",
+            "tool_outline",
+        ]
+        assert tool_results[0]["content"] == "search_course_content result"
+        assert tool_results[1]["content"] == "get_course_outline result"
 
-        except Exception as e:
-            print(f"❌ Max rounds enforcement failed: {e}")
-            raise
+    def test_api_error_handling(self, mock_client, ai_generator):
+        """Test API error handling"""
+        ai_generator.client = mock_client
+
+        # Simulate API error
+        mock_client.messages.create.side_effect = Exception(
+            "API Error: Rate limit exceeded"
+        )
+
+        # This should raise the exception
+        with pytest.raises(Exception) as exc_info:
+            ai_generator.generate_response("test query")
+
+        assert "API Error" in str(exc_info.value)
+
+    def test_retry_honors_retry_after(self, ai_generator):
+        """Test rate-limit retries wait for the server's Retry-After header"""
+        rate_limit = anthropic.RateLimitError(
+            "Rate limited",
+            response=httpx.Response(
+                429,
+                headers={"retry-after": "7"},
+                request=httpx.Request("POST", "https://api.anthropic.com"),
+            ),
+            body=None,
+        )
+        final_response = make_text_response("Recovered")
+        ai_generator.client = make_client(side_effect=[rate_limit, final_response])
+
+        with patch("ai_generator.time.sleep") as mock_sleep:
+            result = ai_generator.generate_response("test query")
+
+        assert result == "Recovered"
+        assert mock_sleep.call_args_list == [call(7.0)]
+
+    def test_retry_backoff_is_jittered(self, ai_generator):
+        """Test transient errors back off exponentially with jitter"""
+        request = httpx.Request("POST", "https://api.anthropic.com")
+        with patch("ai_generator.random.uniform", return_value=1.25):
+            delay = ai_generator._retry_delay(
+                anthropic.APIConnectionError(request=request), 2
+            )
+
+        assert delay == ai_generator.RETRY_BASE_DELAY * 4 * 1.25
+
+        # Classification is by exception type, not message wording
+        assert ai_generator._retry_delay(Exception("network error"), 0) is None
+
+    def test_stream_retries_before_output(self, ai_generator):
+        """Test a stream that fails to open is retried without repeating text"""
+        ai_generator.client = Mock()
+        ai_generator.client.messages.stream.side_effect = [
+            anthropic.APITimeoutError(
+                request=httpx.Request("POST", "https://api.anthropic.com")
+            ),
+            MockStream(
+                [MockStreamEvent(type="text", text="Recovered")],
+                make_text_response("Recovered"),
+            ),
+        ]
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_early_termination_no_tools(
-        self, mock_anthropic, ai_generator, mock_tool_manager
-    ):
-        """Test early termination when Claude doesn't use tools"""
-        print("\\n=== Testing Early Termination (No Tools) ===")
-        try:
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            # Response without tool use
-            direct_response = MockResponse(
-                content=[MockContent(type="text", text="Direct answer without tools")],
-                stop_reason="end_turn",
-            )
+        with patch("ai_generator.time.sleep") as mock_sleep:
+            chunks = list(ai_generator.stream_response("Say hello"))
 
-            mock_client.messages.create.return_value = direct_response
+        assert chunks == ["Recovered"]
+        assert ai_generator.client.messages.stream.call_count == 2
+        mock_sleep.assert_called_once()
 
-            tools = mock_tool_manager.get_tool_definitions()
-            result = ai_generator.generate_response(
-                "What is 2+2?",
-                tools=tools,
-                tool_manager=mock_tool_manager,
-                max_rounds=2,
-            )
+    @pytest.mark.parametrize("streaming", [False, True], ids=["create", "stream"])
+    @patch("ai_generator.time.sleep")
+    def test_transient_tool_error_answers_without_tools(
+        self, mock_sleep, streaming, ai_generator, mock_tool_manager, tools
+    ):
+        """Test a tool still down after retries gets an error result and an answer"""
+        # SDK tool_use blocks have no text attribute, unlike MockContent
+        tool_block = anthropic.types.ToolUseBlock(
+            type="tool_use",
+            id="tool_1",
+            name="search_course_content",
+            input={"query": "agents"},
+        )
+        tool_use_response = MockResponse([tool_block], "tool_use")
+        answer = make_text_response("Course search is unavailable right now")
+        ai_generator.client = make_client(
+            side_effect=respond_with(tool_use_response, answer)
+        )
+        ai_generator.client.messages.stream.side_effect = [
+            MockStream(
+                [MockStreamEvent(type="content_block_stop", content_block=tool_block)],
+                tool_use_response,
+            ),
+            MockStream(
+                [MockStreamEvent(type="text", text=answer.content[0].text)], answer
+            ),
+        ]
+        mock_tool_manager.execute_tool.side_effect = TransientToolError("down")
+
+        kwargs = {"tools": tools, "tool_manager": mock_tool_manager}
+        if streaming:
+            result = "".join(ai_generator.stream_response("About agents?", **kwargs))
+            api_calls = ai_generator.client.messages.stream.call_args_list
+        else:
+            result = ai_generator.generate_response("About agents?", **kwargs)
+            api_calls = ai_generator.client.messages.create.call_args_list
+
+        assert result == "Course search is unavailable right now"
+        assert mock_tool_manager.execute_tool.call_count == 3
+        assert mock_sleep.call_count == 2
+
+        # The error goes back to Claude, whose next round can't call tools
+        assert len(api_calls) == 2
+        final_call = api_calls[1][1]
+        assert final_call["tool_choice"] == {"type": "none"}
+        tool_result = final_call["messages"][-1]["content"][0]
+        assert tool_result["is_error"] is True
+        assert tool_result["content"] == "Tool unavailable: down"
+
+    @pytest.mark.parametrize(
+        "args", [("",), ("query", None, None, None)], ids=["empty_query", "none_args"]
+    )
+    def test_parameter_validation(self, args, ai_generator):
+        """Test edge-case arguments still produce a text response"""
+        ai_generator.client = make_client(
+            return_value=make_text_response("Edge case response")
+        )
+
+        result = ai_generator.generate_response(*args)
+        assert isinstance(result, str)
+
+    @pytest.mark.parametrize(
+        "case", TOOL_ROUNDS_CASES.values(), ids=TOOL_ROUNDS_CASES.keys()
+    )
+    def test_tool_rounds(
+        self, case, mock_client, ai_generator, mock_tool_manager, tools
+    ):
+        """Test tool rounds run in order and the last round answers without tools"""
+        ai_generator.client = mock_client
+        mock_client.messages.create.side_effect = respond_with(
+            *(make_tool_response(*tool_call) for tool_call in case.tool_calls),
+            make_text_response(case.final_text),
+        )
+        mock_tool_manager.execute_tool.side_effect = list(case.tool_results)
+
+        result = ai_generator.generate_response(
+            "Tell me about lesson 3 in MCP Course with detailed content",
+            tools=tools,
+            tool_manager=mock_tool_manager,
+            max_rounds=case.max_rounds,
+        )
+
+        assert result == case.final_text
+        assert mock_tool_manager.execute_tool.call_args_list == [
+            call(name, **tool_input) for _, name, tool_input in case.tool_calls
+        ]
 
-            # Should have made only 1 API call
-            assert mock_client.messages.create.call_count == 1
-            assert mock_tool_manager.execute_tool.call_count == 0
-            assert result == "Direct answer without tools"
-            print("✅ Early termination successful")
+        # One API call per tool round plus the final synthesis
+        rounds = mock_client.messages.create.call_args_list
+        assert len(rounds) == len(case.tool_calls) + 1
 
-        except Exception as e:
-            print(f"❌ Early termination failed: {e}")
-            raise
+        # Final synthesis round keeps tools defined but disables their use
+        assert rounds[-1][1]["tool_choice"] == {"type": "none"}
 
-    @patch("ai_generator.anthropic.Anthropic")
     def test_tool_execution_error_handling(
-        self, mock_anthropic, ai_generator, mock_tool_manager
+        self, mock_client, ai_generator, mock_tool_manager, tools
     ):
         """Test handling of tool execution errors"""
-        print("\\n=== Testing Tool Execution Error Handling ===")
-        try:
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_generator.client = mock_client
-
-            tool_use_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_error",
-                        name="search_course_content",
-                        input={"query": "test"},
-                    )
-                ],
-                stop_reason="tool_use",
-            )
+        ai_generator.client = mock_client
 
-            final_response = MockResponse(
-                content=[MockContent(type="text", text="Handled error gracefully")],
-                stop_reason="end_turn",
-            )
+        tool_use_response = make_tool_response(
+            "tool_error", "search_course_content", {"query": "test"}
+        )
 
-            mock_client.messages.create.side_effect = [
-                tool_use_response,
-                final_response,
-            ]
+        final_response = make_text_response("Handled error gracefully")
+
+        mock_client.messages.create.side_effect = respond_with(
+            tool_use_response, final_response
+        )
+
+        # Simulate tool execution error
+        mock_tool_manager.execute_tool.side_effect = Exception("Tool failed")
+
+        result = ai_generator.generate_response(
+            "Test error handling", tools=tools, tool_manager=mock_tool_manager
+        )
 
-            # Simulate tool execution error
-            mock_tool_manager.execute_tool.side_effect = Exception("Tool failed")
+        # Should still return a response
+        assert result == "Handled error gracefully"
 
-            tools = mock_tool_manager.get_tool_definitions()
-            result = ai_generator.generate_response(
-                "Test error handling", tools=tools, tool_manager=mock_tool_manager
+    def test_stream_response_text(self, mock_client, ai_generator):
+        """Test streaming text deltas without tool usage"""
+        ai_generator.client = mock_client
+
+        final_message = make_text_response("Hello world")
+        mock_client.messages.stream.return_value = MockStream(
+            [
+                MockStreamEvent(type="text", text="Hello "),
+                MockStreamEvent(type="text", text="world"),
+            ],
+            final_message,
+        )
+
+        chunks = list(ai_generator.stream_response("Say hello"))
+
+        assert chunks == ["Hello ", "world"]
+        mock_client.messages.stream.assert_called_once()
+        assert "tools" not in mock_client.messages.stream.call_args[1]
+
+    def test_stream_response_starts_tools_before_stream_ends(
+        self, mock_client, ai_generator, mock_tool_manager, tools
+    ):
+        """Test tools start as soon as their tool_use block completes"""
+        ai_generator.client = mock_client
+
+        tool_block = MockContent(
+            type="tool_use",
+            id="tool_1",
+            name="search_course_content",
+            input={"query": "streaming"},
+        )
+        tool_started = threading.Event()
+        started_before_stream_end = []
+
+        def execute_tool(name, **kwargs):
+            tool_started.set()
+            return "Tool result"
+
+        def first_round_events():
+            yield MockStreamEvent(type="content_block_stop", content_block=tool_block)
+            # Tool should already be running while Claude keeps streaming
+            started_before_stream_end.append(tool_started.wait(timeout=2))
+            yield MockStreamEvent(type="text", text="Searching...")
+
+        first_stream = MockStream(
+            first_round_events(),
+            MockResponse(content=[tool_block], stop_reason="tool_use"),
+        )
+        second_stream = MockStream(
+            [MockStreamEvent(type="text", text="Final answer")],
+            make_text_response("Final answer"),
+        )
+        mock_client.messages.stream.side_effect = respond_with(
+            first_stream, second_stream
+        )
+        mock_tool_manager.execute_tool.side_effect = execute_tool
+
+        chunks = list(
+            ai_generator.stream_response(
+                "Stream with tools",
+                tools=tools,
+                tool_manager=mock_tool_manager,
             )
+        )
 
-            # Should still return a response
-            assert result == "Handled error gracefully"
-            print("✅ Tool execution error handling successful")
+        assert started_before_stream_end == [True]
+        assert chunks == ["Searching...", "Final answer"]
+        assert mock_tool_manager.execute_tool.call_args_list == [
+            call("search_course_content", query="streaming")
+        ]
 
-        except Exception as e:
-            print(f"❌ Tool execution error handling failed: {e}")
-            raise
+        # Second round receives the tool result
+        messages = mock_client.messages.stream.call_args_list[1][1]["messages"]
+        assert messages[2]["role"] == "user"
+        assert messages[2]["content"][0]["tool_use_id"] == "tool_1"
+        assert messages[2]["content"][0]["content"] == "Tool result"
+
+    def test_generate_responses_batched(self, ai_generator):
+        """Test questions are answered in batches and missing answers fall back"""
+        first_batch = make_text_response(
+            '<answers><answer id="1">Answer A</answer>'
+            '<answer id="2">Answer B</answer></answers>'
+        )
+        # Second batch comes back without tags, so its question is retried
+        second_batch = make_text_response("Untagged answer")
+        fallback = make_text_response("Answer C")
+        mock_client = make_client(
+            side_effect=respond_with(first_batch, second_batch, fallback)
+        )
+        ai_generator.client = mock_client
+
+        answers = ai_generator.generate_responses_batched(
+            ["Question A", "Question B", "Question C"], batch_size=2
+        )
+
+        assert answers == ["Answer A", "Answer B", "Answer C"]
+        assert mock_client.messages.create.call_count == 3
+
+        first_call = mock_client.messages.create.call_args_list[0][1]
+        prompt = first_call["messages"][0]["content"]
+        assert "1. Question A\n2. Question B" in prompt
+        assert "tools" not in first_call
+        assert first_call["max_tokens"] == 1600
 
 
 class TestAIGeneratorIntegration:
     """Integration tests with real tool manager"""
 
-    @pytest.fixture
-    def real_tool_manager(self):
-        """Create real tool manager with mock vector store"""
-        from search_tools import CourseOutlineTool, CourseSearchTool
-        from vector_store import VectorStore
+    pytestmark = pytest.mark.integration
 
+    @pytest.fixture(scope="module")
+    def real_tool_manager(self):
+        """Create real tool manager with mock vector store, shared by the class"""
         # Create mock vector store
-        mock_store = Mock(spec=VectorStore)
+        mock_store = StubVectorStore()
 
         # Create real tool manager with both tools
         tool_manager = ToolManager()
@@ -687,164 +763,147 @@ class TestAIGeneratorIntegration:
 
         return tool_manager, mock_store
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_integration_with_real_tools(self, mock_anthropic, real_tool_manager):
-        """Test integration with real tool manager"""
-        print("\\n=== Testing Integration with Real Tools ===")
-        try:
-            tool_manager, mock_store = real_tool_manager
-
-            # Create AI generator
-            ai_gen = AIGenerator("test_key", "test_model")
+    @pytest.fixture(autouse=True)
+    def reset_real_tool_manager(self, real_tool_manager):
+        """Clear stubbed store behaviour and tracked sources between tests"""
+        yield
+        tool_manager, mock_store = real_tool_manager
+        mock_store.reset_mock(return_value=True, side_effect=True)
+        tool_manager.reset_sources()
 
-            # Setup mocks
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_gen.client = mock_client
+    def test_integration_with_real_tools(self, mock_client, real_tool_manager):
+        """Test integration with real tool manager"""
+        tool_manager, mock_store = real_tool_manager
+
+        # Create AI generator; its client is the patched mock
+        ai_gen = AIGenerator("test_key", "test_model")
+
+        # Mock vector store to return results
+        mock_store.search.return_value = SearchResults(
+            documents=["Test course content"],
+            metadata=[{"course_title": "Test Course", "lesson_number": 0}],
+            distances=[0.1],
+        )
+        mock_store.get_lesson_link.return_value = "https://example.com/lesson0"
+
+        # Setup tool use response
+        tool_response = make_tool_response(
+            "tool_1", "search_course_content", {"query": "test content"}
+        )
+
+        final_response = make_text_response("Integration test successful")
+
+        mock_client.messages.create.side_effect = respond_with(
+            tool_response, final_response
+        )
+
+        # Execute
+        result = ai_gen.generate_response(
+            "Tell me about test content",
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager,
+        )
+
+        # Verify vector store was called
+        assert mock_store.search.call_args_list == [
+            call(query="test content", course_name=None, lesson_number=None)
+        ]
 
-            # Mock vector store to return results
-            from vector_store import SearchResults
+        assert result == "Integration test successful"
 
-            mock_store.search.return_value = SearchResults(
-                documents=["Test course content"],
+    @patch("ai_generator.time.sleep")
+    def test_transient_search_failure_retried(
+        self, mock_sleep, mock_client, real_tool_manager
+    ):
+        """Test a dropped store connection is retried and the round continues"""
+        tool_manager, mock_store = real_tool_manager
+        ai_gen = AIGenerator("test_key", "test_model")
+
+        mock_store.search.side_effect = [
+            httpx.ConnectError("Connection refused"),
+            SearchResults(
+                documents=["Recovered content"],
                 metadata=[{"course_title": "Test Course", "lesson_number": 0}],
                 distances=[0.1],
-            )
-            mock_store.get_lesson_link.return_value = "https://example.com/lesson0"
-
-            # Setup tool use response
-            tool_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_1",
-                        name="search_course_content",
-                        input={"query": "test content"},
-                    )
-                ],
-                stop_reason="tool_use",
-            )
-
-            final_response = MockResponse(
-                content=[MockContent(type="text", text="Integration test successful")],
-                stop_reason="end_turn",
-            )
-
-            mock_client.messages.create.side_effect = [tool_response, final_response]
-
-            # Execute
-            result = ai_gen.generate_response(
-                "Tell me about test content",
-                tools=tool_manager.get_tool_definitions(),
-                tool_manager=tool_manager,
-            )
-
-            # Verify vector store was called
-            mock_store.search.assert_called_once_with(
-                query="test content", course_name=None, lesson_number=None
-            )
-
-            assert result == "Integration test successful"
-            print("✅ Integration with real tools successful")
-
-        except Exception as e:
-            print(f"❌ Integration test failed: {e}")
-            raise
+            ),
+        ]
+        mock_store.get_lesson_link.return_value = None
+        mock_client.messages.create.side_effect = respond_with(
+            make_tool_response("tool_1", "search_course_content", {"query": "x"}),
+            make_text_response("Answer after retry"),
+        )
+
+        result = ai_gen.generate_response(
+            "Tell me about x",
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager,
+        )
+
+        assert result == "Answer after retry"
+        assert mock_store.search.call_count == 2
+        assert mock_sleep.call_count == 1
+        second_call = mock_client.messages.create.call_args_list[1][1]
+        tool_result = second_call["messages"][-1]["content"][0]
+        assert "Recovered content" in tool_result["content"]
 
-    @patch("ai_generator.anthropic.Anthropic")
     def test_sequential_integration_with_real_tools(
-        self, mock_anthropic, real_tool_manager
+        self, mock_client, real_tool_manager
     ):
         """Test sequential tool calling with real tool manager"""
-        print("\\n=== Testing Sequential Integration with Real Tools ===")
-        try:
-            tool_manager, mock_store = real_tool_manager
-
-            # Create AI generator
-            ai_gen = AIGenerator("test_key", "test_model")
-
-            # Setup mocks
-            mock_client = Mock()
-            mock_anthropic.return_value = mock_client
-            ai_gen.client = mock_client
-
-            # Mock vector store to return different results for different calls
-            from vector_store import SearchResults
-
-            mock_store.search.side_effect = [
-                SearchResults(
-                    documents=["Course outline content"],
-                    metadata=[{"course_title": "Test Course", "lesson_number": 0}],
-                    distances=[0.1],
-                ),
-                SearchResults(
-                    documents=["Specific lesson content"],
-                    metadata=[{"course_title": "Test Course", "lesson_number": 3}],
-                    distances=[0.1],
-                ),
-            ]
-            mock_store.get_lesson_link.return_value = "https://example.com/lesson"
-            mock_store._resolve_course_name.return_value = "Test Course"
-
-            # Setup sequential tool responses
-            first_tool_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_1",
-                        name="get_course_outline",
-                        input={"course_name": "test"},
-                    )
-                ],
-                stop_reason="tool_use",
-            )
+        tool_manager, mock_store = real_tool_manager
 
-            second_tool_response = MockResponse(
-                content=[
-                    MockContent(
-                        type="tool_use",
-                        id="tool_2",
-                        name="search_course_content",
-                        input={"query": "lesson 3", "lesson_number": 3},
-                    )
-                ],
-                stop_reason="tool_use",
-            )
+        # Create AI generator; its client is the patched mock
+        ai_gen = AIGenerator("test_key", "test_model")
 
-            final_response = MockResponse(
-                content=[
-                    MockContent(type="text", text="Sequential integration successful")
-                ],
-                stop_reason="end_turn",
-            )
+        # Mock vector store to return different results for different calls
+        mock_store.search.side_effect = [
+            SearchResults(
+                documents=["Course outline content"],
+                metadata=[{"course_title": "Test Course", "lesson_number": 0}],
+                distances=[0.1],
+            ),
+            SearchResults(
+                documents=["Specific lesson content"],
+                metadata=[{"course_title": "Test Course", "lesson_number": 3}],
+                distances=[0.1],
+            ),
+        ]
+        mock_store.get_lesson_link.return_value = "https://example.com/lesson"
+        mock_store._resolve_course_name.return_value = "Test Course"
 
-            mock_client.messages.create.side_effect = [
-                first_tool_response,
-                second_tool_response,
-                final_response,
-            ]
-
-            # Execute with sequential tool calling
-            result = ai_gen.generate_response(
-                "Get course outline then search lesson 3",
-                tools=tool_manager.get_tool_definitions(),
-                tool_manager=tool_manager,
-                max_rounds=2,
-            )
+        # Setup sequential tool responses
+        first_tool_response = make_tool_response(
+            "tool_1", "get_course_outline", {"course_name": "test"}
+        )
+
+        second_tool_response = make_tool_response(
+            "tool_2",
+            "search_course_content",
+            {"query": "lesson 3", "lesson_number": 3},
+        )
+
+        final_response = make_text_response("Sequential integration successful")
+
+        mock_client.messages.create.side_effect = respond_with(
+            first_tool_response, second_tool_response, final_response
+        )
 
-            # Verify both search operations were called
-            assert (
-                mock_store.search.call_count == 1
-            )  # Only content search, outline uses different method
+        # Execute with sequential tool calling
+        result = ai_gen.generate_response(
+            "Get course outline then search lesson 3",
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager,
+            max_rounds=3,
+        )
 
-            assert result == "Sequential integration successful"
-            print("✅ Sequential integration with real tools successful")
+        # Verify both search operations were called
+        assert (
+            mock_store.search.call_count == 1
+        )  # Only content search, outline uses different method
 
-        except Exception as e:
-            print(f"❌ Sequential integration test failed: {e}")
-            raise
+        assert result == "Sequential integration successful"
 
 
 if __name__ == "__main__":
     print("Running AIGenerator tests...")
-    pytest.main([__file__, "-v", "-s"])
+    pytest.main([__file__, "-v"])
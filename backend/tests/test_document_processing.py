@@ -1,7 +1,7 @@
 import os
 import sys
 import tempfile
-from unittest.mock import mock_open, patch
+from unittest.mock import call, mock_open, patch
 
 import pytest
 
@@ -56,7 +56,9 @@ Unsupervised learning works with data that has no labels or target outputs. The
         try:
             test_content = "Test content with UTF-8: café, naïve, résumé"
 
-            with patch("builtins.open", mock_open(read_data=test_content)):
+            with patch(
+                "builtins.open", mock_open(read_data=test_content.encode("utf-8"))
+            ):
                 result = processor.read_file("test.txt")
                 assert result == test_content
 
@@ -72,12 +74,8 @@ Unsupervised learning works with data that has no labels or target outputs. The
         try:
             test_content = "Fallback content"
 
-            # Mock first call to raise UnicodeDecodeError, second to succeed
-            mock_file = mock_open(read_data=test_content)
-            mock_file.return_value.read.side_effect = [
-                UnicodeDecodeError("utf-8", b"", 0, 1, "invalid"),
-                test_content,
-            ]
+            # Invalid UTF-8 bytes are dropped instead of failing the read
+            mock_file = mock_open(read_data=b"Fallback\xff content")
 
             with patch("builtins.open", mock_file):
                 result = processor.read_file("test.txt")
@@ -89,6 +87,11 @@ Unsupervised learning works with data that has no labels or target outputs. The
             print(f"❌ Encoding error handling failed: {e}")
             raise
 
+    def test_read_file_newlines(self, processor):
+        """Test Windows and old Mac line endings are normalized like text mode"""
+        with patch("builtins.open", mock_open(read_data=b"One\r\nTwo\rThree\n")):
+            assert processor.read_file("test.txt") == "One\nTwo\nThree\n"
+
     def test_chunk_text_basic(self, processor):
         """Test basic text chunking functionality"""
         print("\\n=== Testing Basic Text Chunking ===")
@@ -214,9 +217,8 @@ Unsupervised learning works with data that has no labels or target outputs. The
 
                     # Verify contextual prefixes are added
                     if chunk.lesson_number is not None:
-                        assert (
+                        assert chunk.content.startswith(
                             f"Course {course.title} Lesson {chunk.lesson_number} content:"
-                            in chunk.content
                         )
 
                 print(
@@ -361,10 +363,14 @@ This is lesson one content that should also get a contextual prefix."""
 
                 # Verify prefixes
                 for chunk in lesson_0_chunks:
-                    assert "Course Test Course Lesson 0 content:" in chunk.content
+                    assert chunk.content.startswith(
+                        "Course Test Course Lesson 0 content:"
+                    )
 
                 for chunk in lesson_1_chunks:
-                    assert "Course Test Course Lesson 1 content:" in chunk.content
+                    assert chunk.content.startswith(
+                        "Course Test Course Lesson 1 content:"
+                    )
 
                 print("✅ Contextual prefixes test successful")
 
@@ -380,9 +386,7 @@ This is lesson one content that should also get a contextual prefix."""
             long_content = """Course Title: Long Course
 
 Lesson 0: Very Long Lesson
-""" + " ".join(
-                [f"This is sentence number {i}." for i in range(50)]
-            )
+""" + " ".join([f"This is sentence number {i}." for i in range(50)])
 
             with patch.object(processor, "read_file", return_value=long_content):
                 course, chunks = processor.process_course_document("long.txt")
@@ -453,7 +457,90 @@ This is real content from a real file that we're using to test the document proc
             print(f"❌ Real file processing failed: {e}")
             raise
 
+    def test_process_real_file_cached(self, temp_file):
+        """Test unchanged files are parsed once and changed files re-parsed"""
+        processor = DocumentProcessor(chunk_size=200, chunk_overlap=50)
+
+        with patch.object(
+            processor, "read_file", wraps=processor.read_file
+        ) as read_file:
+            first = processor.process_course_document(temp_file)
+            expected = (
+                first[0].model_copy(deep=True),
+                [c.model_copy() for c in first[1]],
+            )
+
+            # Callers get their own objects, so mutating one can't leak
+            first[0].lessons[0].lesson_link = "https://example.com/changed"
+            first[1][0].content = "Changed"
+            first[1].clear()
+
+            second = processor.process_course_document(temp_file)
+            assert second[0] == expected[0]
+            assert [chunk.content for chunk in second[1]] == [
+                chunk.content for chunk in expected[1]
+            ]
+            assert second[0] is not first[0]
+            assert read_file.call_count == 1
+
+            with open(temp_file, "a") as f:
+                f.write(" More content.")
+            course, chunks = processor.process_course_document(temp_file)
+            assert read_file.call_count == 2
+            assert "More content." in chunks[-1].content
+
+    def test_process_many(self, temp_file, tmp_path):
+        """Test big batches are parsed in worker processes, in input order"""
+        other_file = tmp_path / "other.txt"
+        other_file.write_text(
+            "Course Title: Other Course\n\nLesson 1: Intro\nOther content here."
+        )
+        processor = DocumentProcessor(chunk_size=200, chunk_overlap=50)
+        processor.PARALLEL_MIN_FILES = 2
+
+        results = processor.process_many([temp_file, str(other_file), temp_file])
+
+        assert [course.title for course, _ in results] == [
+            "Real File Test",
+            "Other Course",
+            "Real File Test",
+        ]
+
+        # Worker results fill the parent's cache
+        with patch.object(processor, "read_file") as read_file:
+            assert results[0] == processor.process_course_document(temp_file)
+            read_file.assert_not_called()
+
+    def test_process_many_small_batch_inline(self, temp_file, tmp_path):
+        """Test small batches skip the pool and cached files skip parsing"""
+        other_file = tmp_path / "other.txt"
+        other_file.write_text("Course Title: Other Course\n\nLesson 1: Intro\nHi.")
+        processor = DocumentProcessor(chunk_size=200, chunk_overlap=50)
+        cached = processor.process_course_document(temp_file)
+
+        with (
+            patch("document_processor.ProcessPoolExecutor") as pool,
+            patch.object(
+                processor, "read_file", wraps=processor.read_file
+            ) as read_file,
+        ):
+            results = processor.process_many([temp_file, str(other_file)])
+
+        pool.assert_not_called()
+        assert read_file.call_args_list == [call(str(other_file))]
+        assert results[0] == cached
+        assert results[1][0].title == "Other Course"
+
+    def test_process_many_failure(self, temp_file, tmp_path):
+        """Test a document that fails yields its exception without stopping others"""
+        processor = DocumentProcessor(chunk_size=200, chunk_overlap=50)
+
+        results = processor.process_many([str(tmp_path / "missing.txt"), temp_file])
+
+        assert isinstance(results[0], Exception)
+        assert results[1][0].title == "Real File Test"
+
 
 if __name__ == "__main__":
     print("Running DocumentProcessor tests...")
-    pytest.main([__file__, "-v", "-s"])
+    pytest.main([__file__, "-v"])
@@ -1,5 +1,8 @@
+import contextvars
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
@@ -263,6 +266,31 @@ class TestCourseSearchTool:
             print(f"❌ Result formatting test failed: {e}")
             raise
 
+    def test_result_formatting_reuses_lesson_links(
+        self, search_tool, mock_vector_store
+    ):
+        """Test results from the same lesson look up its link only once"""
+        mock_vector_store.search.return_value = SearchResults(
+            documents=["First chunk", "Second chunk"],
+            metadata=[
+                {"course_title": "Course A", "lesson_number": 0},
+                {"course_title": "Course A", "lesson_number": 0},
+            ],
+            distances=[0.1, 0.2],
+        )
+        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson0"
+
+        result = search_tool.execute("content")
+
+        assert result == (
+            "[Course A - Lesson 0]\nFirst chunk\n\n[Course A - Lesson 0]\nSecond chunk"
+        )
+        mock_vector_store.get_lesson_link.assert_called_once_with("Course A", 0)
+        assert [s["lesson_link"] for s in search_tool.last_sources] == [
+            "https://example.com/lesson0",
+            "https://example.com/lesson0",
+        ]
+
     def test_source_tracking(
         self, search_tool, mock_vector_store, sample_search_results
     ):
@@ -376,6 +404,12 @@ class TestCourseOutlineTool:
 class TestToolManager:
     """Test suite for ToolManager functionality"""
 
+    @pytest.fixture
+    def mock_vector_store(self):
+        """Create mock VectorStore for testing"""
+        mock_store = Mock(spec=VectorStore)
+        return mock_store
+
     @pytest.fixture
     def tool_manager(self):
         """Create ToolManager instance for testing"""
@@ -412,6 +446,13 @@ class TestToolManager:
 
             assert len(definitions) == 1
             assert definitions[0]["name"] == "search_course_content"
+            assert definitions[-1]["cache_control"] == {
+                "type": "ephemeral",
+                "ttl": "5m",
+            }
+
+            # Definitions are built once at registration and reused
+            assert tool_manager.get_tool_definitions() is definitions
             print("✅ Get tool definitions successful")
 
         except Exception as e:
@@ -484,7 +525,147 @@ class TestToolManager:
             print(f"❌ Source management test failed: {e}")
             raise
 
+    def test_session_sources_isolated_per_context(
+        self, tool_manager, mock_search_tool, mock_vector_store
+    ):
+        """Test concurrent request contexts don't see each other's sources"""
+        mock_vector_store.search.return_value = SearchResults(
+            documents=["Test content"],
+            metadata=[{"course_title": "Test Course", "lesson_number": 0}],
+            distances=[0.1],
+        )
+        mock_vector_store.get_lesson_link.return_value = None
+        tool_manager.register_tool(mock_search_tool)
+
+        def run_request(execute: bool) -> list:
+            tool_manager.reset_sources()
+            if execute:
+                tool_manager.execute_tool("search_course_content", query="test")
+            return tool_manager.get_all_sources_from_session()
+
+        first = contextvars.copy_context().run(run_request, True)
+        second = contextvars.copy_context().run(run_request, False)
+
+        assert len(first) == 1
+        assert second == ()
+
+    def test_last_sources_from_tool_thread(
+        self, tool_manager, mock_search_tool, mock_vector_store
+    ):
+        """Test last sources from a tool run in a copied context reach the request"""
+        mock_vector_store.search.return_value = SearchResults(
+            documents=["Test content"],
+            metadata=[{"course_title": "Test Course", "lesson_number": 0}],
+            distances=[0.1],
+        )
+        mock_vector_store.get_lesson_link.return_value = None
+        tool_manager.register_tool(mock_search_tool)
+
+        def run_request() -> list:
+            tool_manager.reset_sources()
+            # Tools run on executor threads in a copy of the request context
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(
+                    contextvars.copy_context().run,
+                    tool_manager.execute_tool,
+                    "search_course_content",
+                    query="test",
+                ).result()
+            return tool_manager.get_last_sources()
+
+        first = contextvars.copy_context().run(run_request)
+        second = contextvars.copy_context().run(tool_manager.get_last_sources)
+
+        assert [s["display_text"] for s in first] == ["Test Course - Lesson 0"]
+        assert second == []
+
+    def test_concurrent_calls_overlap(
+        self, tool_manager, mock_search_tool, mock_vector_store
+    ):
+        """Test concurrent calls to one tool run together and keep their sources"""
+        # Both searches must be inside the tool at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def search(query, course_name=None, lesson_number=None):
+            barrier.wait()
+            return SearchResults(
+                documents=[query],
+                metadata=[{"course_title": query, "lesson_number": None}],
+                distances=[0.1],
+            )
+
+        mock_vector_store.search.side_effect = search
+        tool_manager.register_tool(mock_search_tool)
+
+        def run_request(query: str) -> list:
+            tool_manager.reset_sources()
+            tool_manager.execute_tool("search_course_content", query=query)
+            return [s["display_text"] for s in tool_manager.session_sources]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, run_request, query)
+                for query in ("Course A", "Course B")
+            ]
+            results = [future.result() for future in futures]
+
+        assert results == [["Course A"], ["Course B"]]
+
+    def test_session_sources_deduplicated_and_bounded(
+        self, mock_search_tool, mock_vector_store
+    ):
+        """Test repeated sources are recorded once and old ones drop past the cap"""
+        tool_manager = ToolManager(max_sources=2)
+        tool_manager.register_tool(mock_search_tool)
+        mock_vector_store.get_lesson_link.return_value = None
+
+        for lesson_number in (0, 0, 1, 2):
+            mock_vector_store.search.return_value = SearchResults(
+                documents=["Test content"],
+                metadata=[{"course_title": "Course A", "lesson_number": lesson_number}],
+                distances=[0.1],
+            )
+            tool_manager.execute_tool("search_course_content", query="test")
+
+        sources = tool_manager.get_all_sources_from_session()
+        assert [s["display_text"] for s in sources] == [
+            "Course A - Lesson 1",
+            "Course A - Lesson 2",
+        ]
+
+    def test_last_sources_follow_latest_tool(
+        self, tool_manager, mock_search_tool, mock_vector_store
+    ):
+        """Test last sources come from whichever tool produced them most recently"""
+        mock_vector_store.search.return_value = SearchResults(
+            documents=["Test content"],
+            metadata=[{"course_title": "Test Course", "lesson_number": 0}],
+            distances=[0.1],
+        )
+        mock_vector_store.get_lesson_link.return_value = None
+        mock_vector_store._resolve_course_name.return_value = "Test Course"
+        mock_vector_store.course_catalog = Mock()
+        mock_vector_store.course_catalog.get.return_value = {
+            "metadatas": [{"title": "Test Course", "course_link": "https://c.com"}]
+        }
+
+        outline_tool = CourseOutlineTool(mock_vector_store)
+        tool_manager.register_tool(mock_search_tool)
+        tool_manager.register_tool(outline_tool)
+
+        tool_manager.execute_tool("search_course_content", query="test")
+        tool_manager.execute_tool("get_course_outline", course_name="Test")
+
+        sources = tool_manager.get_last_sources()
+        assert sources == [
+            {
+                "display_text": "Test Course - Course Outline",
+                "lesson_link": "https://c.com",
+            }
+        ]
+        assert len(tool_manager.get_all_sources_from_session()) == 2
+
 
 if __name__ == "__main__":
     print("Running CourseSearchTool tests...")
-    pytest.main([__file__, "-v", "-s"])
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,132 @@
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Add backend to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache
+
+# Fixed vectors so similarity is known without loading an embedding model
+VECTORS = {
+    "What is MCP?": [1.0, 0.0, 0.0],
+    "What's MCP?": [0.99, 0.05, 0.0],
+    "Tell me about MCP": [1.0, 0.01, 0.0],
+    "Who teaches the RAG course?": [0.0, 1.0, 0.0],
+    "Explain lesson 3": [0.0, 0.0, 1.0],
+    "Explain lesson 4": [0.0, 0.01, 1.0],
+}
+
+
+def fake_embed(texts):
+    return [np.array(VECTORS[text]) for text in texts]
+
+
+class TestSemanticCache:
+    """Test suite for SemanticCache functionality"""
+
+    @pytest.fixture
+    def cache(self):
+        """Create SemanticCache with a deterministic embedder"""
+        return SemanticCache(fake_embed, threshold=0.98, max_entries=2, ttl=300)
+
+    def test_exact_hit(self, cache):
+        """Test exact query match returns the payload"""
+        cache.put("What is MCP?", ("MCP answer", []))
+        assert cache.get("What is MCP?") == ("MCP answer", [])
+
+    def test_semantic_hit(self, cache):
+        """Test near-identical query above the threshold returns the payload"""
+        cache.put("What is MCP?", ("MCP answer", []))
+        assert cache.get("What's MCP?") == ("MCP answer", [])
+
+    def test_different_lesson_number_misses(self, cache):
+        """Test near-identical queries about different lessons don't share answers"""
+        cache.put("Explain lesson 3", "lesson 3")
+        assert cache.get("Explain lesson 4") is None
+
+    def test_expired_match_does_not_hide_live_match(self, cache):
+        """Test a stale best match falls through to a live one above the threshold"""
+        with patch("semantic_cache.time.monotonic", return_value=0):
+            cache.put("What is MCP?", "stale")
+        with patch("semantic_cache.time.monotonic", return_value=200):
+            cache.put("What's MCP?", "live")
+
+        with patch("semantic_cache.time.monotonic", return_value=350):
+            assert cache.get("Tell me about MCP") == "live"
+
+    def test_exact_only_by_default(self):
+        """Test the default cache answers exact repeats without embedding"""
+        calls = []
+        cache = SemanticCache(lambda texts: calls.append(texts) or fake_embed(texts))
+        cache.put("What is MCP?", "mcp")
+
+        assert cache.get("What is MCP?") == "mcp"
+        assert cache.get("What's MCP?") is None
+        assert calls == []
+
+    def test_miss_below_threshold(self, cache):
+        """Test unrelated query misses"""
+        cache.put("What is MCP?", ("MCP answer", []))
+        assert cache.get("Who teaches the RAG course?") is None
+
+    def test_empty_cache_skips_embedding(self):
+        """Test lookups on an empty cache never call the embedder"""
+        calls = []
+        cache = SemanticCache(lambda texts: calls.append(texts) or fake_embed(texts))
+        assert cache.get("What is MCP?") is None
+        assert calls == []
+
+    def test_get_exact_skips_embedding(self):
+        """Test exact lookups hit stored queries without calling the embedder"""
+        calls = []
+        cache = SemanticCache(lambda texts: calls.append(texts) or fake_embed(texts))
+        cache.put("What is MCP?", "mcp")
+        calls.clear()
+
+        assert cache.get_exact("What is MCP?") == "mcp"
+        assert cache.get_exact("What's MCP?") is None
+        assert calls == []
+
+    def test_embed_reuses_recent_vectors(self):
+        """Test a query embedded for a lookup is not embedded again"""
+        calls = []
+        cache = SemanticCache(
+            lambda texts: calls.append(texts) or fake_embed(texts), threshold=0.98
+        )
+        cache.put("What is MCP?", "mcp")
+        assert cache.get("What's MCP?") == "mcp"
+        assert cache.get("What's MCP?") == "mcp"
+        assert calls == [["What is MCP?"], ["What's MCP?"]]
+
+    def test_lru_eviction(self, cache):
+        """Test least recently used entry is evicted when full"""
+        cache.put("What is MCP?", "mcp")
+        cache.put("Who teaches the RAG course?", "rag")
+        cache.get("What is MCP?")  # Touch so RAG becomes least recent
+        cache.put("Explain lesson 3", "lesson")
+
+        assert cache.get("Who teaches the RAG course?") is None
+        assert cache.get("What is MCP?") == "mcp"
+        assert cache.get("Explain lesson 3") == "lesson"
+
+    def test_ttl_expiry(self, cache):
+        """Test stale entries are dropped and their slot reused"""
+        with patch("semantic_cache.time.monotonic", return_value=0):
+            cache.put("What is MCP?", "mcp")
+            cache.put("Who teaches the RAG course?", "rag")
+
+        with patch("semantic_cache.time.monotonic", return_value=301):
+            assert cache.get("What is MCP?") is None
+            cache.put("Explain lesson 3", "lesson")
+            assert cache.get("Explain lesson 3") == "lesson"
+            assert len(cache.slots) == 2
+
+    def test_clear(self, cache):
+        """Test clear drops all entries"""
+        cache.put("What is MCP?", "mcp")
+        cache.clear()
+        assert cache.get("What is MCP?") is None
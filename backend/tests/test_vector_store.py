@@ -1,7 +1,5 @@
 import os
-import shutil
 import sys
-import tempfile
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
@@ -17,19 +15,40 @@ class TestVectorStore:
     """Test suite for VectorStore functionality"""
 
     @pytest.fixture
-    def temp_dir(self):
-        """Create temporary directory for test ChromaDB"""
-        temp_dir = tempfile.mkdtemp()
-        yield temp_dir
-        shutil.rmtree(temp_dir)
+    def temp_dir(self, tmp_path):
+        """Provide a temporary directory for test ChromaDB, cleaned up by pytest"""
+        return str(tmp_path)
 
-    @pytest.fixture
-    def vector_store(self, temp_dir):
-        """Create VectorStore instance for testing"""
+    @pytest.fixture(scope="class")
+    def shared_vector_store(self, tmp_path_factory):
+        """Create one VectorStore so ChromaDB and the embedder load once"""
         return VectorStore(
-            chroma_path=temp_dir, embedding_model="all-MiniLM-L6-v2", max_results=5
+            chroma_path=str(tmp_path_factory.mktemp("chroma")),
+            embedding_model="all-MiniLM-L6-v2",
+            max_results=5,
         )
 
+    @pytest.fixture
+    def vector_store(self, shared_vector_store):
+        """Provide the shared VectorStore with both collections emptied"""
+        for collection in (
+            shared_vector_store.course_catalog,
+            shared_vector_store.course_content,
+        ):
+            ids = collection.get(include=[])["ids"]
+            if ids:
+                collection.delete(ids=ids)
+        shared_vector_store._clear_lookup_caches()
+        return shared_vector_store
+
+    @pytest.fixture
+    def mock_vector_store(self):
+        """Create VectorStore over mock ChromaDB for tests of pure logic"""
+        with patch("vector_store.chromadb"):
+            return VectorStore(
+                chroma_path="unused", embedding_model="all-MiniLM-L6-v2", max_results=5
+            )
+
     @pytest.fixture
     def sample_course(self):
         """Create sample course data"""
@@ -77,289 +96,323 @@ class TestVectorStore:
 
     def test_vector_store_initialization(self, temp_dir):
         """Test VectorStore initialization and collection creation"""
-        print("\\n=== Testing VectorStore Initialization ===")
-        try:
-            vector_store = VectorStore(temp_dir, "all-MiniLM-L6-v2", 5)
-            assert vector_store.max_results == 5
-            assert vector_store.course_catalog is not None
-            assert vector_store.course_content is not None
-            print("✅ VectorStore initialization successful")
-
-            # Test collections exist
-            collections = vector_store.client.list_collections()
-            collection_names = [c.name for c in collections]
-            assert "course_catalog" in collection_names
-            assert "course_content" in collection_names
-            print("✅ Collections created successfully")
-
-        except Exception as e:
-            print(f"❌ VectorStore initialization failed: {e}")
-            raise
+        vector_store = VectorStore(temp_dir, "all-MiniLM-L6-v2", 5)
+        assert vector_store.max_results == 5
+        assert vector_store.course_catalog is not None
+        assert vector_store.course_content is not None
+
+        # Test collections exist
+        collections = vector_store.client.list_collections()
+        collection_names = [c.name for c in collections]
+        assert "course_catalog" in collection_names
+        assert "course_content" in collection_names
 
     def test_add_course_metadata(self, vector_store, sample_course):
         """Test adding course metadata to catalog"""
-        print("\\n=== Testing Add Course Metadata ===")
-        try:
-            # Add course metadata
-            vector_store.add_course_metadata(sample_course)
-            print("✅ Course metadata added successfully")
-
-            # Verify data was added
-            results = vector_store.course_catalog.get(ids=["Test Course"])
-            assert results is not None
-            assert len(results["ids"]) == 1
-            assert results["ids"][0] == "Test Course"
-
-            metadata = results["metadatas"][0]
-            assert metadata["title"] == "Test Course"
-            assert metadata["instructor"] == "Test Instructor"
-            assert metadata["course_link"] == "https://example.com/course"
-            assert metadata["lesson_count"] == 2
-            print("✅ Course metadata verification successful")
-
-        except Exception as e:
-            print(f"❌ Add course metadata failed: {e}")
-            raise
+        # Add course metadata
+        vector_store.add_course_metadata(sample_course)
+
+        # Verify data was added
+        results = vector_store.course_catalog.get(ids=["Test Course"])
+        assert results is not None
+        assert len(results["ids"]) == 1
+        assert results["ids"][0] == "Test Course"
+
+        metadata = results["metadatas"][0]
+        assert metadata["title"] == "Test Course"
+        assert metadata["instructor"] == "Test Instructor"
+        assert metadata["course_link"] == "https://example.com/course"
+        assert metadata["lesson_count"] == 2
 
     def test_add_course_content(self, vector_store, sample_chunks):
         """Test adding course content chunks"""
-        print("\\n=== Testing Add Course Content ===")
-        try:
-            # Add course content
-            vector_store.add_course_content(sample_chunks)
-            print("✅ Course content added successfully")
-
-            # Verify data was added
-            all_data = vector_store.course_content.get()
-            assert len(all_data["ids"]) == 3
-            assert len(all_data["documents"]) == 3
-            assert len(all_data["metadatas"]) == 3
-
-            # Check metadata structure
-            for i, metadata in enumerate(all_data["metadatas"]):
-                assert metadata["course_title"] == "Test Course"
-                assert "lesson_number" in metadata
-                assert "chunk_index" in metadata
-
-            print("✅ Course content verification successful")
-
-        except Exception as e:
-            print(f"❌ Add course content failed: {e}")
-            raise
+        # Add course content
+        vector_store.add_course_content(sample_chunks)
+
+        # Verify data was added
+        all_data = vector_store.course_content.get(
+            include=["documents", "metadatas", "embeddings"]
+        )
+        assert len(all_data["ids"]) == 3
+        assert len(all_data["documents"]) == 3
+        assert len(all_data["metadatas"]) == 3
+        assert len(all_data["embeddings"]) == 3
+
+        # Check metadata structure
+        for i, metadata in enumerate(all_data["metadatas"]):
+            assert metadata["course_title"] == "Test Course"
+            assert "lesson_number" in metadata
+            assert "chunk_index" in metadata
 
     def test_course_name_resolution(self, vector_store, sample_course):
         """Test semantic course name resolution"""
-        print("\\n=== Testing Course Name Resolution ===")
-        try:
-            # Add course first
-            vector_store.add_course_metadata(sample_course)
-
+        # Add course first
+        vector_store.add_course_metadata(sample_course)
+
+        with patch.object(
+            vector_store.course_catalog,
+            "query",
+            wraps=vector_store.course_catalog.query,
+        ) as mock_query:
             # Test exact match
             result = vector_store._resolve_course_name("Test Course")
             assert result == "Test Course"
-            print("✅ Exact course name match successful")
 
             # Test partial match
-            result = vector_store._resolve_course_name("Test")
+            result = vector_store._resolve_course_name("test")
             assert result == "Test Course"
-            print("✅ Partial course name match successful")
 
-            # Test no match
-            result = vector_store._resolve_course_name("NonexistentCourse")
-            assert result is None
-            print("✅ No match handling successful")
+            # Title matches never need a vector search
+            mock_query.assert_not_called()
 
-        except Exception as e:
-            print(f"❌ Course name resolution failed: {e}")
-            raise
+        # Test no match
+        result = vector_store._resolve_course_name("NonexistentCourse")
+        assert result is None
 
-    def test_filter_building(self, vector_store):
+    def test_filter_building(self, mock_vector_store):
         """Test ChromaDB filter building"""
-        print("\\n=== Testing Filter Building ===")
-        try:
-            # Test no filters
-            filter_dict = vector_store._build_filter(None, None)
-            assert filter_dict is None
-            print("✅ No filters case successful")
-
-            # Test course only
-            filter_dict = vector_store._build_filter("Test Course", None)
-            assert filter_dict == {"course_title": "Test Course"}
-            print("✅ Course filter only successful")
-
-            # Test lesson only
-            filter_dict = vector_store._build_filter(None, 1)
-            assert filter_dict == {"lesson_number": 1}
-            print("✅ Lesson filter only successful")
-
-            # Test both filters
-            filter_dict = vector_store._build_filter("Test Course", 1)
-            expected = {"$and": [{"course_title": "Test Course"}, {"lesson_number": 1}]}
-            assert filter_dict == expected
-            print("✅ Combined filters successful")
-
-        except Exception as e:
-            print(f"❌ Filter building failed: {e}")
-            raise
+        # Test no filters
+        filter_dict = mock_vector_store._build_filter(None, None)
+        assert filter_dict is None
 
-    def test_search_functionality(self, vector_store, sample_course, sample_chunks):
-        """Test main search functionality"""
-        print("\\n=== Testing Search Functionality ===")
-        try:
-            # Add test data
-            vector_store.add_course_metadata(sample_course)
-            vector_store.add_course_content(sample_chunks)
-
-            # Test basic search
-            results = vector_store.search("introduction")
-            assert not results.error
-            assert len(results.documents) > 0
-            print("✅ Basic search successful")
-
-            # Test search with course filter
-            results = vector_store.search("advanced", course_name="Test Course")
-            assert not results.error
-            assert len(results.documents) > 0
-            # Verify all results are from the specified course
-            for metadata in results.metadata:
-                assert metadata["course_title"] == "Test Course"
-            print("✅ Course-filtered search successful")
-
-            # Test search with lesson filter
-            results = vector_store.search("content", lesson_number=1)
-            assert not results.error
-            assert len(results.documents) > 0
-            # Verify all results are from the specified lesson
-            for metadata in results.metadata:
-                assert metadata["lesson_number"] == 1
-            print("✅ Lesson-filtered search successful")
-
-            # Test search with both filters
-            results = vector_store.search(
-                "advanced", course_name="Test", lesson_number=1
-            )
-            assert not results.error
-            print("✅ Combined filter search successful")
+        # Test course only
+        filter_dict = mock_vector_store._build_filter("Test Course", None)
+        assert filter_dict == {"course_title": "Test Course"}
 
-            # Test search with no matches
-            results = vector_store.search("nonexistent topic")
-            assert not results.error
-            # May or may not have results depending on similarity threshold
-            print("✅ No matches search handled")
+        # Test lesson only
+        filter_dict = mock_vector_store._build_filter(None, 1)
+        assert filter_dict == {"lesson_number": 1}
 
-            # Test invalid course name
-            results = vector_store.search("content", course_name="NonexistentCourse")
-            assert results.error is not None
-            assert "No course found matching" in results.error
-            print("✅ Invalid course name handled")
+        # Test both filters
+        filter_dict = mock_vector_store._build_filter("Test Course", 1)
+        expected = {"$and": [{"course_title": "Test Course"}, {"lesson_number": 1}]}
+        assert filter_dict == expected
 
-        except Exception as e:
-            print(f"❌ Search functionality failed: {e}")
-            raise
+    def test_search_functionality(self, vector_store, sample_course, sample_chunks):
+        """Test main search functionality"""
+        # Add test data
+        vector_store.add_course_metadata(sample_course)
+        vector_store.add_course_content(sample_chunks)
+
+        # Test basic search
+        results = vector_store.search("introduction")
+        assert not results.error
+        assert len(results.documents) > 0
+
+        # Test search with course filter
+        results = vector_store.search("advanced", course_name="Test Course")
+        assert not results.error
+        assert len(results.documents) > 0
+        # Verify all results are from the specified course
+        for metadata in results.metadata:
+            assert metadata["course_title"] == "Test Course"
+
+        # Test search with lesson filter
+        results = vector_store.search("content", lesson_number=1)
+        assert not results.error
+        assert len(results.documents) > 0
+        # Verify all results are from the specified lesson
+        for metadata in results.metadata:
+            assert metadata["lesson_number"] == 1
+
+        # Test search with both filters
+        results = vector_store.search("advanced", course_name="Test", lesson_number=1)
+        assert not results.error
+
+        # Test search with no matches
+        results = vector_store.search("nonexistent topic")
+        assert not results.error
+        # May or may not have results depending on similarity threshold
+
+        # Test invalid course name
+        results = vector_store.search("content", course_name="NonexistentCourse")
+        assert results.error is not None
+        assert "No course found matching" in results.error
 
     def test_utility_methods(self, vector_store, sample_course, sample_chunks):
         """Test utility methods"""
-        print("\\n=== Testing Utility Methods ===")
-        try:
-            # Test with empty store
-            count = vector_store.get_course_count()
-            assert count == 0
-            print("✅ Empty store course count successful")
-
-            titles = vector_store.get_existing_course_titles()
-            assert len(titles) == 0
-            print("✅ Empty store course titles successful")
-
-            # Add data
-            vector_store.add_course_metadata(sample_course)
-            vector_store.add_course_content(sample_chunks)
-
-            # Test with data
-            count = vector_store.get_course_count()
-            assert count == 1
-            print("✅ Course count with data successful")
-
-            titles = vector_store.get_existing_course_titles()
-            assert len(titles) == 1
-            assert "Test Course" in titles
-            print("✅ Course titles with data successful")
-
-            # Test course link retrieval
-            link = vector_store.get_course_link("Test Course")
-            assert link == "https://example.com/course"
-            print("✅ Course link retrieval successful")
-
-            # Test lesson link retrieval
-            lesson_link = vector_store.get_lesson_link("Test Course", 0)
-            assert lesson_link == "https://example.com/lesson0"
-            print("✅ Lesson link retrieval successful")
-
-        except Exception as e:
-            print(f"❌ Utility methods failed: {e}")
-            raise
-
-    def test_error_handling(self, vector_store):
+        # Test with empty store
+        count = vector_store.get_course_count()
+        assert count == 0
+
+        titles = vector_store.get_existing_course_titles()
+        assert len(titles) == 0
+
+        # Add data
+        vector_store.add_course_metadata(sample_course)
+        vector_store.add_course_content(sample_chunks)
+
+        # Test with data
+        count = vector_store.get_course_count()
+        assert count == 1
+
+        titles = vector_store.get_existing_course_titles()
+        assert len(titles) == 1
+        assert "Test Course" in titles
+
+        # Test course link retrieval
+        link = vector_store.get_course_link("Test Course")
+        assert link == "https://example.com/course"
+
+        # Test lesson link retrieval
+        lesson_link = vector_store.get_lesson_link("Test Course", 0)
+        assert lesson_link == "https://example.com/lesson0"
+
+    def test_link_lookups_cached(self, vector_store, sample_course):
+        """Test link lookups read the catalog once until it changes"""
+        vector_store.add_course_metadata(sample_course)
+
+        with patch.object(
+            vector_store.course_catalog,
+            "get",
+            wraps=vector_store.course_catalog.get,
+        ) as mock_get:
+            vector_store.prefetch_course_links(["Test Course", "Missing Course"])
+            assert vector_store.get_lesson_link("Test Course", 1) == (
+                "https://example.com/lesson1"
+            )
+            assert vector_store.get_course_link("Test Course") == (
+                "https://example.com/course"
+            )
+            assert vector_store.get_lesson_link("Missing Course", 0) is None
+            assert mock_get.call_count == 1
+
+            # Re-adding course metadata invalidates cached links
+            vector_store.add_course_metadata(
+                Course(
+                    title="Other Course",
+                    course_link="https://example.com/other",
+                    instructor="Other Instructor",
+                )
+            )
+            vector_store.get_course_link("Test Course")
+            assert mock_get.call_count == 2
+
+    def test_links_seeded_at_ingest(self, vector_store, sample_course):
+        """Test links of a newly added course are served without a catalog read"""
+        vector_store.add_course_metadata(sample_course)
+
+        with patch.object(
+            vector_store.course_catalog,
+            "get",
+            wraps=vector_store.course_catalog.get,
+        ) as mock_get:
+            assert vector_store.get_course_link("Test Course") == (
+                "https://example.com/course"
+            )
+            assert vector_store.get_lesson_link("Test Course", 0) == (
+                "https://example.com/lesson0"
+            )
+            mock_get.assert_not_called()
+
+    def test_course_titles_cached(self, vector_store, sample_course):
+        """Test catalog titles and counts read the catalog once until it changes"""
+        vector_store.add_course_metadata(sample_course)
+
+        with patch.object(
+            vector_store.course_catalog,
+            "get",
+            wraps=vector_store.course_catalog.get,
+        ) as mock_get:
+            assert vector_store.get_existing_course_titles() == ["Test Course"]
+            assert vector_store.get_course_count() == 1
+            assert mock_get.call_count == 1
+
+            # Adding a course invalidates the cached titles
+            vector_store.add_course_metadata(
+                Course(
+                    title="Other Course",
+                    course_link="https://example.com/other",
+                    instructor="Other Instructor",
+                )
+            )
+            assert vector_store.get_course_count() == 2
+            assert mock_get.call_count == 2
+
+    def test_search_cached(self, vector_store, sample_chunks):
+        """Test repeated searches skip ChromaDB until the content changes"""
+        vector_store.add_course_content(sample_chunks[:2])
+
+        with patch.object(
+            vector_store.course_content,
+            "query",
+            wraps=vector_store.course_content.query,
+        ) as mock_query:
+            first = vector_store.search("Advanced Concepts", lesson_number=1)
+            assert vector_store.search("  advanced   CONCEPTS ", lesson_number=1) is (
+                first
+            )
+            assert mock_query.call_count == 1
+            # The query is embedded as given; only the cache key is normalized
+            assert mock_query.call_args[1]["query_texts"] == ["Advanced Concepts"]
+
+            # Different filters are cached separately
+            vector_store.search("advanced concepts")
+            assert mock_query.call_count == 2
+
+            # Adding content invalidates cached searches
+            vector_store.add_course_content(sample_chunks[2:])
+            results = vector_store.search("advanced concepts", lesson_number=1)
+            assert mock_query.call_count == 3
+            assert len(results.documents) == 2
+
+    def test_course_similarity(self, vector_store, sample_course, sample_chunks):
+        """Test routing scores course titles and seeds the search cache"""
+        assert vector_store.max_course_similarity("Test Course") is None
+
+        # A course title matches before any of its content is indexed
+        vector_store.add_course_metadata(sample_course)
+        assert vector_store.max_course_similarity("Test Course") == pytest.approx(1)
+
+        vector_store.add_course_content(sample_chunks)
+        query = "More advanced content in lesson 1"
+        assert vector_store.max_course_similarity(query) == pytest.approx(1)
+
+        # The routing query's results answer the matching unfiltered search
+        with patch.object(vector_store.course_content, "query") as mock_query:
+            results = vector_store.search(query)
+            mock_query.assert_not_called()
+        assert results.documents[0] == query
+
+    def test_error_handling(self, mock_vector_store):
         """Test error handling in various scenarios"""
-        print("\\n=== Testing Error Handling ===")
-        try:
-            # Test search with mock that raises exception
-            with patch.object(
-                vector_store.course_content,
-                "query",
-                side_effect=Exception("ChromaDB Error"),
-            ):
-                results = vector_store.search("test query")
-                assert results.error is not None
-                assert "Search error" in results.error
-            print("✅ Search error handling successful")
-
-            # Test course name resolution with mock exception
-            with patch.object(
-                vector_store.course_catalog,
-                "query",
-                side_effect=Exception("Resolution Error"),
-            ):
-                result = vector_store._resolve_course_name("Test Course")
-                assert result is None
-            print("✅ Course resolution error handling successful")
-
-        except Exception as e:
-            print(f"❌ Error handling test failed: {e}")
-            raise
+        # Test search with a collection that raises
+        mock_vector_store.course_content.query.side_effect = Exception("ChromaDB Error")
+        results = mock_vector_store.search("test query")
+        assert results.error is not None
+        assert "Search error" in results.error
+
+        # Test course name resolution with a catalog that raises
+        mock_vector_store.course_catalog.query.side_effect = Exception(
+            "Resolution Error"
+        )
+        result = mock_vector_store._resolve_course_name("Test Course")
+        assert result is None
 
 
 def test_search_results_class():
     """Test SearchResults helper class"""
-    print("\\n=== Testing SearchResults Class ===")
-    try:
-        # Test from_chroma creation
-        chroma_results = {
-            "documents": [["doc1", "doc2"]],
-            "metadatas": [["meta1", "meta2"]],
-            "distances": [[0.1, 0.2]],
-        }
-        results = SearchResults.from_chroma(chroma_results)
-        assert len(results.documents) == 2
-        assert len(results.metadata) == 2
-        assert len(results.distances) == 2
-        print("✅ SearchResults from_chroma successful")
-
-        # Test empty results
-        empty_results = SearchResults.empty("Test error")
-        assert empty_results.error == "Test error"
-        assert empty_results.is_empty()
-        print("✅ SearchResults empty creation successful")
-
-        # Test is_empty method
-        non_empty = SearchResults(["doc"], [{}], [0.1])
-        assert not non_empty.is_empty()
-        print("✅ SearchResults is_empty method successful")
-
-    except Exception as e:
-        print(f"❌ SearchResults test failed: {e}")
-        raise
+    # Test from_chroma creation
+    chroma_results = {
+        "documents": [["doc1", "doc2"]],
+        "metadatas": [["meta1", "meta2"]],
+        "distances": [[0.1, 0.2]],
+    }
+    results = SearchResults.from_chroma(chroma_results)
+    assert len(results.documents) == 2
+    assert len(results.metadata) == 2
+    assert len(results.distances) == 2
+
+    # Test empty results
+    empty_results = SearchResults.empty("Test error")
+    assert empty_results.error == "Test error"
+    assert empty_results.is_empty()
+
+    # Test is_empty method
+    non_empty = SearchResults(["doc"], [{}], [0.1])
+    assert not non_empty.is_empty()
 
 
 if __name__ == "__main__":
     print("Running VectorStore tests...")
-    pytest.main([__file__, "-v", "-s"])
+    pytest.main([__file__, "-v"])
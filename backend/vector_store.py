@@ -1,10 +1,23 @@
+import json
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence
 
 import chromadb
+import httpx
 from chromadb.config import Settings
+from chromadb.errors import RateLimitError
 from models import Course, CourseChunk
-from sentence_transformers import SentenceTransformer
+
+# Store failures that clear up on their own: dropped or timed-out connections
+# to a Chroma server, or server-side throttling
+TRANSIENT_STORE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    httpx.TransportError,
+    RateLimitError,
+)
 
 
 @dataclass
@@ -46,10 +59,24 @@ class VectorStore:
 
     def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5):
         self.max_results = max_results
-        # Initialize ChromaDB client
-        self.client = chromadb.PersistentClient(
-            path=chroma_path, settings=Settings(anonymized_telemetry=False)
-        )
+
+        # Lookup caches over the course catalog, cleared whenever it changes
+        self._course_name_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._course_name_cache_size = 1024
+        self._course_links: Dict[str, Dict[str, Any]] = {}  # Title -> links
+        self._course_titles: Optional[List[str]] = None  # Catalog ids, in order
+        # (normalized query, course, lesson, limit) -> results, least recent first
+        self._search_cache: "OrderedDict[tuple, SearchResults]" = OrderedDict()
+        self._search_cache_size = 1024
+        self.catalog_version = 0  # Bumped whenever the course catalog changes
+        self._cache_lock = threading.Lock()
+        # Initialize ChromaDB client; ":memory:" keeps the store in process, and
+        # every in-memory store in a process shares the same collections
+        settings = Settings(anonymized_telemetry=False)
+        if chroma_path == ":memory:":
+            self.client = chromadb.EphemeralClient(settings=settings)
+        else:
+            self.client = chromadb.PersistentClient(path=chroma_path, settings=settings)
 
         # Set up sentence transformer embedding function
         self.embedding_function = (
@@ -90,6 +117,10 @@ class VectorStore:
 
         Returns:
             SearchResults object with documents and metadata
+
+        Raises:
+            One of TRANSIENT_STORE_ERRORS when the store is temporarily
+            unavailable, so callers can retry instead of reporting no results
         """
         # Step 1: Resolve course name if provided
         course_title = None
@@ -105,26 +136,125 @@ class VectorStore:
         # Use provided limit or fall back to configured max_results
         search_limit = limit if limit is not None else self.max_results
 
+        # Variants differing only in case and spacing share a cache entry;
+        # Chroma still embeds the query exactly as given
+        normalized = " ".join(query.lower().split())
+        cache_key = (normalized, course_title, lesson_number, search_limit)
+        with self._cache_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                self._search_cache.move_to_end(cache_key)
+                return cached
+
         try:
             results = self.course_content.query(
                 query_texts=[query], n_results=search_limit, where=filter_dict
             )
-            return SearchResults.from_chroma(results)
+        except TRANSIENT_STORE_ERRORS:
+            raise
         except Exception as e:
             return SearchResults.empty(f"Search error: {str(e)}")
 
+        search_results = SearchResults.from_chroma(results)
+        with self._cache_lock:
+            self._search_cache[cache_key] = search_results
+            if len(self._search_cache) > self._search_cache_size:
+                self._search_cache.popitem(last=False)
+        return search_results
+
+    def max_course_similarity(
+        self, query: str, query_embedding: Optional[Sequence[float]] = None
+    ) -> Optional[float]:
+        """
+        Get cosine similarity between a query and its closest course or chunk.
+
+        Course titles are scored alongside the content, so a question naming a
+        course counts as related even when no chunk is close. The content
+        query fetches a full page of results and seeds the search cache, so a
+        tool search for the same unfiltered query is served without Chroma.
+
+        Args:
+            query: Text to compare against the course catalog and content
+            query_embedding: Precomputed embedding of the query, if available
+
+        Returns:
+            Similarity in [-1, 1], or None if the store is empty or unavailable
+        """
+        # Reuse a caller's embedding rather than encoding the query again
+        if query_embedding is not None:
+            query_args = {"query_embeddings": [query_embedding]}
+        else:
+            query_args = {"query_texts": [query]}
+
+        try:
+            catalog = self.course_catalog.query(
+                **query_args, n_results=1, include=["distances"]
+            )
+            content = self.course_content.query(
+                **query_args,
+                n_results=self.max_results,
+                include=["documents", "metadatas", "distances"],
+            )
+        except Exception as e:
+            print(f"Error scoring query against the courses: {e}")
+            return None
+
+        cache_key = (" ".join(query.lower().split()), None, None, self.max_results)
+        with self._cache_lock:
+            self._search_cache[cache_key] = SearchResults.from_chroma(content)
+            if len(self._search_cache) > self._search_cache_size:
+                self._search_cache.popitem(last=False)
+
+        distances = [
+            results["distances"][0][0]
+            for results in (catalog, content)
+            if results["distances"] and results["distances"][0]
+        ]
+        if not distances:
+            return None
+
+        # Embeddings are unit length, so squared L2 distance is 2 - 2 * cosine
+        return 1 - min(distances) / 2
+
     def _resolve_course_name(self, course_name: str) -> Optional[str]:
         """Use vector search to find best matching course by name"""
-        try:
-            results = self.course_catalog.query(query_texts=[course_name], n_results=1)
+        # Course names repeat across queries, so reuse earlier resolutions
+        with self._cache_lock:
+            if course_name in self._course_name_cache:
+                self._course_name_cache.move_to_end(course_name)
+                return self._course_name_cache[course_name]
+
+        course_title = self._match_course_title(course_name)
+        if course_title is None:
+            try:
+                results = self.course_catalog.query(
+                    query_texts=[course_name], n_results=1
+                )
+            except Exception as e:
+                print(f"Error resolving course name: {e}")
+                return None
 
             if results["documents"][0] and results["metadatas"][0]:
                 # Return the title (which is now the ID)
-                return results["metadatas"][0][0]["title"]
-        except Exception as e:
-            print(f"Error resolving course name: {e}")
+                course_title = results["metadatas"][0][0]["title"]
+
+        with self._cache_lock:
+            self._course_name_cache[course_name] = course_title
+            if len(self._course_name_cache) > self._course_name_cache_size:
+                self._course_name_cache.popitem(last=False)
+
+        return course_title
+
+    def _match_course_title(self, course_name: str) -> Optional[str]:
+        """Match a name against catalog titles without a vector search"""
+        titles = self._get_course_titles() or []
+        if course_name in titles:
+            return course_name
 
-        return None
+        # Accept a case-insensitive substring only when it picks out one course
+        needle = course_name.lower()
+        matches = [title for title in titles if needle in title.lower()]
+        return matches[0] if len(matches) == 1 else None
 
     def _build_filter(
         self, course_title: Optional[str], lesson_number: Optional[int]
@@ -149,8 +279,6 @@ class VectorStore:
 
     def add_course_metadata(self, course: Course):
         """Add course information to the catalog for semantic search"""
-        import json
-
         course_text = course.title
 
         # Build lessons metadata and serialize as JSON string
@@ -179,6 +307,17 @@ class VectorStore:
             ],
             ids=[course.title],
         )
+        self._clear_lookup_caches()
+
+        # Seed the links from the course itself, so lookups skip the catalog
+        with self._cache_lock:
+            self._course_links[course.title] = {
+                "course_link": course.course_link,
+                "lessons": {
+                    lesson.lesson_number: lesson.lesson_link
+                    for lesson in course.lessons
+                },
+            }
 
     def add_course_content(self, chunks: List[CourseChunk]):
         """Add course content chunks to the vector store"""
@@ -201,6 +340,8 @@ class VectorStore:
         ]
 
         self.course_content.add(documents=documents, metadatas=metadatas, ids=ids)
+        with self._cache_lock:
+            self._search_cache.clear()
 
     def clear_all_data(self):
         """Clear all data from both collections"""
@@ -212,34 +353,47 @@ class VectorStore:
             self.course_content = self._create_collection("course_content")
         except Exception as e:
             print(f"Error clearing data: {e}")
+        self._clear_lookup_caches()
+
+    def _clear_lookup_caches(self):
+        """Drop cached course lookups and searches after the catalog changes"""
+        with self._cache_lock:
+            self._course_name_cache.clear()
+            self._search_cache.clear()
+            self._course_links.clear()
+            self._course_titles = None
+            self.catalog_version += 1
 
     def get_existing_course_titles(self) -> List[str]:
         """Get all existing course titles from the vector store"""
-        try:
-            # Get all documents from the catalog
-            results = self.course_catalog.get()
-            if results and "ids" in results:
-                return results["ids"]
-            return []
-        except Exception as e:
-            print(f"Error getting existing course titles: {e}")
-            return []
+        titles = self._get_course_titles()
+        return list(titles) if titles is not None else []
 
     def get_course_count(self) -> int:
         """Get the total number of courses in the vector store"""
+        titles = self._get_course_titles()
+        return len(titles) if titles is not None else 0
+
+    def _get_course_titles(self) -> Optional[List[str]]:
+        """Get the catalog's titles, cached until the catalog changes"""
+        with self._cache_lock:
+            if self._course_titles is not None:
+                return self._course_titles
+
         try:
-            results = self.course_catalog.get()
-            if results and "ids" in results:
-                return len(results["ids"])
-            return 0
+            # Titles are the catalog ids, so skip documents and metadata
+            results = self.course_catalog.get(include=[])
         except Exception as e:
-            print(f"Error getting course count: {e}")
-            return 0
+            print(f"Error getting existing course titles: {e}")
+            return None
+
+        titles = results["ids"] if results and "ids" in results else []
+        with self._cache_lock:
+            self._course_titles = titles
+        return titles
 
     def get_all_courses_metadata(self) -> List[Dict[str, Any]]:
         """Get metadata for all courses in the vector store"""
-        import json
-
         try:
             results = self.course_catalog.get()
             if results and "metadatas" in results:
@@ -259,35 +413,48 @@ class VectorStore:
             print(f"Error getting courses metadata: {e}")
             return []
 
-    def get_course_link(self, course_title: str) -> Optional[str]:
-        """Get course link for a given course title"""
+    def prefetch_course_links(self, course_titles: Iterable[str]):
+        """
+        Load course and lesson links for several courses in one catalog read.
+
+        Args:
+            course_titles: Titles whose links will be looked up next
+        """
+        with self._cache_lock:
+            missing = {
+                title for title in course_titles if title not in self._course_links
+            }
+        if not missing:
+            return
+
+        # Titles not in the catalog are cached as having no links
+        links = {title: {"course_link": None, "lessons": {}} for title in missing}
         try:
-            # Get course by ID (title is the ID)
-            results = self.course_catalog.get(ids=[course_title])
-            if results and "metadatas" in results and results["metadatas"]:
-                metadata = results["metadatas"][0]
-                return metadata.get("course_link")
-            return None
+            results = self.course_catalog.get(ids=list(missing))
+            for title, metadata in zip(results["ids"], results["metadatas"]):
+                lessons = json.loads(metadata.get("lessons_json") or "[]")
+                links[title] = {
+                    "course_link": metadata.get("course_link"),
+                    "lessons": {
+                        lesson.get("lesson_number"): lesson.get("lesson_link")
+                        for lesson in lessons
+                    },
+                }
         except Exception as e:
-            print(f"Error getting course link: {e}")
-            return None
+            print(f"Error prefetching course links: {e}")
+            return
+
+        with self._cache_lock:
+            self._course_links.update(links)
+
+    def get_course_link(self, course_title: str) -> Optional[str]:
+        """Get course link for a given course title"""
+        self.prefetch_course_links([course_title])
+        links = self._course_links.get(course_title)
+        return links["course_link"] if links else None
 
     def get_lesson_link(self, course_title: str, lesson_number: int) -> Optional[str]:
         """Get lesson link for a given course title and lesson number"""
-        import json
-
-        try:
-            # Get course by ID (title is the ID)
-            results = self.course_catalog.get(ids=[course_title])
-            if results and "metadatas" in results and results["metadatas"]:
-                metadata = results["metadatas"][0]
-                lessons_json = metadata.get("lessons_json")
-                if lessons_json:
-                    lessons = json.loads(lessons_json)
-                    # Find the lesson with matching number
-                    for lesson in lessons:
-                        if lesson.get("lesson_number") == lesson_number:
-                            return lesson.get("lesson_link")
-            return None
-        except Exception as e:
-            print(f"Error getting lesson link: {e}")
+        self.prefetch_course_links([course_title])
+        links = self._course_links.get(course_title)
+        return links["lessons"].get(lesson_number) if links else None
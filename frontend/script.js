@@ -94,6 +94,9 @@ async function sendMessage() {
             currentSessionId = data.session_id;
         }
 
+        // Generation can fail after part of the answer has been streamed
+        if (data.error) throw new Error(data.error);
+
         // Replace loading message with response
         loadingMessage.remove();
         addMessage(data.answer, 'assistant', data.sources);
@@ -9,19 +9,20 @@ from pathlib import Path
 
 
 def run_command(cmd: list, description: str) -> bool:
-    """Run a command and return success status"""
+    """Run a command, streaming its output, and return success status"""
     print(f"Running {description}...")
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
+        # Print output as it arrives rather than after the command exits
+        with subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        ) as process:
+            for line in process.stdout:
+                print(line, end="", flush=True)
+        if process.returncode == 0:
             print(f"✓ {description} completed successfully")
-            if result.stdout:
-                print(result.stdout)
             return True
         else:
             print(f"✗ {description} failed")
-            if result.stderr:
-                print(result.stderr)
             return False
     except Exception as e:
         print(f"✗ {description} failed with error: {e}")
@@ -35,9 +36,10 @@ def main():
     # Change to project root
     project_root = Path(__file__).parent.parent
     
+    # Run with the project's interpreter, so tools start without a uv resolve each
     commands = [
-        (["uv", "run", "isort", "."], "Import sorting (isort)"),
-        (["uv", "run", "black", "."], "Code formatting (black)"),
+        ([sys.executable, "-m", "isort", "."], "Import sorting (isort)"),
+        ([sys.executable, "-m", "black", "."], "Code formatting (black)"),
     ]
     
     success_count = 0
@@ -5,27 +5,31 @@ Development script for code linting
 
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
 def run_command(cmd: list, description: str) -> bool:
     """Run a command and return success status"""
-    print(f"Running {description}...")
+    # Commands run concurrently, so print each one's report in a single call
+    report = [f"Running {description}..."]
     try:
         result = subprocess.run(cmd, capture_output=True, text=True)
         if result.returncode == 0:
-            print(f"✓ {description} passed")
+            report.append(f"✓ {description} passed")
             return True
         else:
-            print(f"✗ {description} failed")
+            report.append(f"✗ {description} failed")
             if result.stdout:
-                print(result.stdout)
+                report.append(result.stdout)
             if result.stderr:
-                print(result.stderr)
+                report.append(result.stderr)
             return False
     except Exception as e:
-        print(f"✗ {description} failed with error: {e}")
+        report.append(f"✗ {description} failed with error: {e}")
         return False
+    finally:
+        print("\n".join(report))
 
 
 def main():
@@ -35,17 +39,18 @@ def main():
     # Change to project root
     project_root = Path(__file__).parent.parent
     
+    # Run with the project's interpreter, so tools start without a uv resolve each
     commands = [
-        (["uv", "run", "flake8", "backend/", "--max-line-length=88", "--extend-ignore=E203,W503"], "Style checking (flake8)"),
-        (["uv", "run", "mypy", "backend/", "--ignore-missing-imports"], "Type checking (mypy)"),
+        ([sys.executable, "-m", "flake8", "backend/", "--max-line-length=88", "--extend-ignore=E203,W503"], "Style checking (flake8)"),
+        ([sys.executable, "-m", "mypy", "backend/", "--ignore-missing-imports"], "Type checking (mypy)"),
     ]
     
-    success_count = 0
     total_count = len(commands)
     
-    for cmd, description in commands:
-        if run_command(cmd, description):
-            success_count += 1
+    # Linters only read the code, so run them side by side
+    with ThreadPoolExecutor(max_workers=total_count) as executor:
+        results = executor.map(lambda command: run_command(*command), commands)
+        success_count = sum(results)
     
     print(f"\n📊 Linting complete: {success_count}/{total_count} tools passed")
     
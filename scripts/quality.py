@@ -3,9 +3,8 @@
 Development script for running all code quality checks
 """
 
-import subprocess
+import importlib
 import sys
-from pathlib import Path
 
 
 def run_script(script_name: str, description: str) -> bool:
@@ -15,10 +14,9 @@ def run_script(script_name: str, description: str) -> bool:
     print('='*50)
     
     try:
-        script_path = Path(__file__).parent / f"{script_name}.py"
-        result = subprocess.run([sys.executable, str(script_path)], 
-                              capture_output=False, text=True)
-        return result.returncode == 0
+        # Scripts sit next to this one, so run their main() in this interpreter
+        script = importlib.import_module(script_name)
+        return script.main() == 0
     except Exception as e:
         print(f"✗ Failed to run {description}: {e}")
         return False
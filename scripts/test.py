@@ -3,27 +3,27 @@
 Development script for running tests
 """
 
+import os
 import subprocess
 import sys
 from pathlib import Path
 
 
 def run_command(cmd: list, description: str) -> bool:
-    """Run a command and return success status"""
+    """Run a command, streaming its output, and return success status"""
     print(f"Running {description}...")
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
+        # Print output as it arrives rather than after the command exits
+        with subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        ) as process:
+            for line in process.stdout:
+                print(line, end="", flush=True)
+        if process.returncode == 0:
             print(f"✓ {description} passed")
-            if result.stdout:
-                print(result.stdout)
             return True
         else:
             print(f"✗ {description} failed")
-            if result.stdout:
-                print(result.stdout)
-            if result.stderr:
-                print(result.stderr)
             return False
     except Exception as e:
         print(f"✗ {description} failed with error: {e}")
@@ -41,6 +41,16 @@ def main():
         (["uv", "run", "pytest", "backend/tests/", "-v"], "Unit tests (pytest)"),
     ]
     
+    # In CI, hand the process over to pytest; its own report is the summary
+    if os.environ.get("CI"):
+        cmd, _ = commands[0]
+        sys.stdout.flush()  # exec discards unflushed output
+        try:
+            os.execvp(cmd[0], cmd)
+        except OSError as e:
+            print(f"✗ Could not start {cmd[0]}: {e}")
+            return 1
+    
     success_count = 0
     total_count = len(commands)
     